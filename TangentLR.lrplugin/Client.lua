@@ -592,6 +592,34 @@ LrTasks.startAsyncTask(
           LrSelection.setRating(newrating)
         end
       end,
+      StepPhoto          = function(value) -- move by a net number of photos (negative is backwards) in one go
+        local steps = math.floor(tonumber(value))
+        if steps == 0 then return end
+        local catalog = LrApplication.activeCatalog()
+        local current = catalog:getTargetPhoto()
+        if current and #catalog:getTargetPhotos() == 1 then
+          -- select the photo we end up on directly, so LR doesn't load each one on the way
+          local filmstrip = catalog:getMultipleSelectedOrAllPhotos() -- all of it, as only one is selected
+          for i, photo in ipairs(filmstrip) do
+            if photo.localIdentifier == current.localIdentifier then
+              local target = math.max(1, math.min(#filmstrip, i + steps)) -- stops at the ends, as nextPhoto does
+              if target ~= i then
+                catalog:setSelectedPhotos(filmstrip[target], {})
+              end
+              return
+            end
+          end
+        end
+        -- several photos selected (LR steps within the selection), or none: one step at a time
+        local step = LrSelection.nextPhoto
+        if steps < 0 then
+          step = LrSelection.previousPhoto
+          steps = -steps
+        end
+        for _ = 1, steps do
+          step()
+        end
+      end,
     }
 
 
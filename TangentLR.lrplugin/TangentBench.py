@@ -0,0 +1,373 @@
+#!/usr/bin/env python
+# Should work with both Python 2.7 and 3
+
+# Benchmarks for the hot paths in TangentBridge.
+# Run from the plugin directory (or `make bench`):
+#   ./TangentBench.py                          run them all
+#   ./TangentBench.py -k dispatch -k decode    run only those whose names contain these
+#   ./TangentBench.py --json new.json          save the results
+#   ./TangentBench.py --compare old.json       fail (exit 1) if anything is more than --threshold worse
+
+import argparse
+import collections
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+import TangentBridge
+import TangentGenerator
+import TangentMappingDefinitions
+from TangentBridge import Bridge, Connection, FrameDecoder, LineDecoder, monotonic, rd4, u4, encf, encstr
+from TangentSim import LoadGenerator, StandInLR, in_process, listen, start_bridge, stop_bridge
+
+FRAMES = 100000
+MAP_ROUNDS = 20
+
+# A result more than this much worse than the baseline (as a fraction) counts as a regression
+THRESHOLD = 0.2
+
+RESULTS = collections.OrderedDict() # name -> (value, unit, True if higher is better; None if just for information)
+
+def sample_frames(n):
+    ''' A representative mix of Tangent frames, each with its length word '''
+    templates = [
+        u4(0x02) + u4(0x203) + encf(0.01),     # param change
+        u4(0x08) + u4(0x103),                   # button down
+        u4(0x0a) + u4(1) + u4(0),               # transport
+        u4(0x36) + encstr('MyCustomParam') + encf(-0.01), # custom param change
+    ]
+    stream = bytearray()
+    for i in range(n):
+        pkt = templates[i % len(templates)]
+        stream += u4(len(pkt)) + pkt
+    return bytes(stream)
+
+def sample_lines(n):
+    ''' A representative mix of MIDI2LR messages '''
+    templates = [b'Exposure 0.512345\n', b'Temperature 0.25\n', b'SplitToningShadowSaturation 0.75\n']
+    return b''.join([templates[i % len(templates)] for i in range(n)])
+
+def chunked(data, minsize, maxsize, seed=1):
+    ''' Splits data into chunks of random size, as a socket might deliver it '''
+    rng = random.Random(seed)
+    chunks = []
+    pos = 0
+    while pos < len(data):
+        size = rng.randint(minsize, maxsize)
+        chunks.append(data[pos:pos+size])
+        pos += size
+    return chunks
+
+class NullSocket(object):
+    ''' Stands in for a connected socket; swallows everything written to it '''
+    def setblocking(self, flag):
+        pass
+    def send(self, data):
+        return len(data)
+    def recv(self, size):
+        return b''
+    def fileno(self):
+        return -1
+    def close(self):
+        pass
+
+class BenchBridge(Bridge):
+    ''' A Bridge that talks to NullSockets '''
+    def connectAll(self):
+        self.Tangent = Connection('Tangent', NullSocket())
+        self.LRSend = Connection('LR send', NullSocket())
+        self.LRRecv = Connection('LR receive', NullSocket())
+
+def local_bridge():
+    '''
+    Starts a bridge connected to plain local sockets standing in for the Hub and LR, running in a thread.
+    Returns (bridge, hub socket, LR send socket, LR receive socket, thread).
+    '''
+    return start_bridge(listen(), listen(), listen())
+
+def recv_frame(sock):
+    ''' Blocking read of one Tangent frame '''
+    def recv_exactly(n):
+        data = b''
+        while len(data) < n:
+            more = sock.recv(n - len(data))
+            if not more:
+                raise EOFError
+            data += more
+        return data
+    return recv_exactly(rd4(recv_exactly(4)))
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered)-1, int(len(ordered) * p / 100.0))]
+
+def record(name, value, unit, higherIsBetter):
+    RESULTS[name] = (value, unit, higherIsBetter)
+    print('%-48s %10.2f %s' % (name, value, unit))
+
+def report(name, count, elapsed, unit='frames'):
+    record(name, count/elapsed, unit+'/s', True)
+
+def report_latency(name, p50, p99, scale=1e3, unit='ms'):
+    record(name+' p50', p50*scale, unit, False)
+    record(name+' p99', p99*scale, unit, False)
+
+def bench_frame_decode():
+    stream = sample_frames(FRAMES)
+    for name,chunks in [
+            ('frame decode: fragmented (1-16 bytes)', chunked(stream, 1, 16)),
+            ('frame decode: fragmented (1-64 bytes)', chunked(stream, 1, 64)),
+            ('frame decode: concatenated (64k reads)', chunked(stream, 65536, 65536)),
+            ]:
+        decoder = FrameDecoder()
+        count = 0
+        start = monotonic()
+        for c in chunks:
+            count += len(decoder.feed(c))
+        elapsed = monotonic() - start
+        assert count == FRAMES, 'decoded %d of %d frames' % (count, FRAMES)
+        report(name, count, elapsed)
+
+def bench_line_decode():
+    stream = sample_lines(FRAMES)
+    for name,chunks in [
+            ('line decode: fragmented (1-64 bytes)', chunked(stream, 1, 64)),
+            ('line decode: concatenated (64k reads)', chunked(stream, 65536, 65536)),
+            ]:
+        decoder = LineDecoder()
+        count = 0
+        start = monotonic()
+        for c in chunks:
+            count += len(decoder.feed(c))
+        elapsed = monotonic() - start
+        assert count == FRAMES, 'decoded %d of %d lines' % (count, FRAMES)
+        report(name, count, elapsed, 'lines')
+
+def bench_dispatch():
+    bridge = BenchBridge(sys.argv[0])
+    for name,pkt in [
+            ('dispatch: 0x02 param change', u4(0x02) + u4(0x203) + encf(0.0001)),
+            ('dispatch: 0x08 button down', u4(0x08) + u4(0x104)),
+            ('dispatch: 0x0a transport', u4(0x0a) + u4(1) + u4(0)),
+            ]:
+        frame = FrameDecoder().feed(u4(len(pkt)) + pkt)[0]
+        handle = bridge.handleTangent
+        flush = bridge.flushOutput
+        start = monotonic()
+        for i in range(FRAMES):
+            handle(frame)
+            flush()
+        elapsed = monotonic() - start
+        bridge.runTimers()
+        report(name, FRAMES, elapsed, 'packets')
+
+def bench_lr_parse():
+    ''' handleLR on value messages from LR, as they'd arrive while a dial is turned '''
+    bridge = BenchBridge(sys.argv[0])
+    lines = sample_lines(FRAMES).split(b'\n')[:-1]
+    handle = bridge.handleLR
+    flush = bridge.flushOutput
+    start = monotonic()
+    for line in lines:
+        handle(line)
+        flush()
+    elapsed = monotonic() - start
+    bridge.flushDisplays()
+    report('LR parse: value messages', len(lines), elapsed, 'lines')
+
+def bench_tangent_encode():
+    ''' Encoding and queueing value updates for the Tangent displays '''
+    bridge = BenchBridge(sys.argv[0])
+    send = bridge.sendTangent
+    flush = bridge.flushOutput
+    for name,encode in [
+            ('Tangent encode: 0x82 value', lambda i: u4(0x82) + u4(0x203) + encf(i * 1e-5) + u4(0)),
+            ('Tangent encode: 0xa6 custom value', lambda i: u4(0xa6) + encstr('MyCustomParam') + encf(i * 1e-5) + u4(0)),
+            ]:
+        start = monotonic()
+        for i in range(FRAMES):
+            send(encode(i))
+            flush()
+        elapsed = monotonic() - start
+        report(name, FRAMES, elapsed, 'packets')
+
+def bench_full_loop():
+    ''' The whole bridge under load from TangentSim: 64 dials at 1kHz, LR 5ms away '''
+    hub, lr, bridge, thread = in_process(0.005)
+    load = LoadGenerator(hub, lr, dials=64, rate=1000, duration=2.0)
+    elapsed, drained = load.run()
+    stop_bridge(bridge, thread, hub, lr)
+    report('full loop: dial ticks', load.sent, elapsed, 'ticks')
+    report('full loop: values reaching LR', load.values(), elapsed, 'values')
+    report_latency('full loop: tick -> LR', load.latency.percentile(50), load.latency.percentile(99))
+    record('full loop: drain after last tick', drained * 1e3, 'ms', None) # too noisy to judge by
+
+def bench_logging():
+    ''' Cost per packet of logging to the ring and a log file, with the hot path's messages off (INFO) and on (DEBUG) '''
+    logdir = tempfile.mkdtemp()
+    pkt = u4(0x02) + u4(0x203) + encf(0.0001)
+    frame = FrameDecoder().feed(u4(len(pkt)) + pkt)[0]
+    try:
+        for level in ('INFO', 'DEBUG'):
+            TangentBridge.setupLogging(getattr(logging, level), os.path.join(logdir, 'bench.log'))
+            bridge = BenchBridge(sys.argv[0])
+            handle = bridge.handleTangent
+            flush = bridge.flushOutput
+            start = monotonic()
+            for i in range(FRAMES):
+                handle(frame)
+                flush()
+            elapsed = monotonic() - start
+            TangentBridge.setupLogging(logging.WARNING) # waits for the writer to catch up
+            record('logging at %s: 0x02 param change' % level, elapsed / FRAMES * 1e6, 'us/packet', False)
+    finally:
+        shutil.rmtree(logdir)
+
+def bench_tangent_latency():
+    ''' Round trip through the bridge for a request it answers without involving LR '''
+    bridge, hub, lrsend, lrrecv, thread = local_bridge()
+    pkt = u4(0x07) + u4(0x112) # menu string request -> 0x83
+    frame = u4(len(pkt)) + pkt
+    samples = []
+    for i in range(5000):
+        start = monotonic()
+        hub.sendall(frame)
+        recv_frame(hub)
+        samples.append(monotonic() - start)
+    stop_bridge(bridge, thread, hub, lrsend, lrrecv)
+    report_latency('Tangent round trip (0x07 -> 0x83)', percentile(samples, 50), percentile(samples, 99), 1e6, 'us')
+
+def populate_mode(hub, mode):
+    '''
+    Acts as the Hub on a mode change: switches mode, then asks for each parameter the mode
+    shows in turn, unless the bridge has already sent it. Returns the time until all were shown.
+    '''
+    wanted = TangentBridge.MODE_PARAMETERS[mode]
+    shown = set()
+    def receive():
+        pkt = recv_frame(hub)
+        if rd4(pkt) == 0x82:
+            shown.add(rd4(pkt, 4))
+    start = monotonic()
+    hub.sendall(u4(8) + u4(9) + u4(mode))
+    for param in wanted:
+        if param in shown:
+            continue
+        hub.sendall(u4(8) + u4(4) + u4(param))
+        while param not in shown:
+            receive()
+    return monotonic() - start
+
+def bench_mode_populate():
+    ''' Time from a mode change until all the mode's displays are filled in, with LR 5ms away '''
+    for prefetch in (False, True):
+        TangentBridge.PREFETCH_ON_MODE_CHANGE = prefetch
+        bridge, hub, lrsend, lrrecv, thread = local_bridge()
+        StandInLR(0.005).attach(lrsend, lrrecv)
+        samples = []
+        for i in range(10):
+            for mode in (1, 3, 12, 50):
+                # A photo change first, so nothing is cached
+                hub.sendall(u4(8) + u4(8) + u4(0x103))
+                samples.append(populate_mode(hub, mode))
+        stop_bridge(bridge, thread, hub, lrsend, lrrecv)
+        report_latency('mode populate (prefetch %s)' % ('on' if prefetch else 'off'),
+              percentile(samples, 50), percentile(samples, 99))
+    TangentBridge.PREFETCH_ON_MODE_CHANGE = True
+
+def bench_map_generation():
+    ''' Building, checking and writing out the XML for the controls file and the panel maps, as the generator does '''
+    defs = TangentMappingDefinitions
+    saved = sys.stdout
+    sys.stdout = open(os.devnull, 'w') # Panel prints as it merges banks
+    out = TangentGenerator.open_xml(os.devnull, 'w')
+    try:
+        times = collections.OrderedDict([ ('controls.xml', 0.0) ] + [ (defs.MAPS[name][0], 0.0) for name in defs.MAPS ])
+        for i in range(MAP_ROUNDS):
+            start = monotonic()
+            out.writelines(defs.controls.emit(0, defs.controls))
+            times['controls.xml'] += monotonic() - start
+            for name in defs.MAPS:
+                filename, factory = defs.MAPS[name]
+                start = monotonic()
+                mf = factory()
+                mf.check(defs.controls)
+                out.writelines(mf.emit(0, defs.controls))
+                times[filename] += monotonic() - start
+    finally:
+        out.close()
+        sys.stdout.close()
+        sys.stdout = saved
+    record('map generation: all files', sum(times.values()) / MAP_ROUNDS * 1e3, 'ms', False)
+    for filename in ('controls.xml', 'wave-map.xml'):
+        record('map generation: %s' % filename, times[filename] / MAP_ROUNDS * 1e3, 'ms', False)
+
+BENCHMARKS = [
+    bench_frame_decode,
+    bench_line_decode,
+    bench_dispatch,
+    bench_lr_parse,
+    bench_tangent_encode,
+    bench_logging,
+    bench_tangent_latency,
+    bench_mode_populate,
+    bench_full_loop,
+    bench_map_generation,
+]
+
+def save(filename):
+    with open(filename, 'w') as f:
+        json.dump({
+            'python': sys.version.split()[0],
+            'results': collections.OrderedDict([ (name, {'value': v, 'unit': unit, 'higher_is_better': hib})
+                                                for name,(v,unit,hib) in RESULTS.items() ]),
+        }, f, indent=2)
+
+def compare(filename, threshold=THRESHOLD):
+    '''
+    Compares RESULTS with those saved in filename. Prints each change, and returns the names of
+    the results that are more than `threshold` (a fraction) worse.
+    '''
+    with open(filename) as f:
+        baseline = json.load(f)['results']
+    regressed = []
+    print('\n%-48s %10s %10s %8s' % ('compared with %s' % filename, 'before', 'after', 'change'))
+    for name,(value,unit,higherIsBetter) in RESULTS.items():
+        if name not in baseline or not baseline[name]['value']:
+            continue
+        before = baseline[name]['value']
+        change = (value - before) / before
+        worse = -change if higherIsBetter else change
+        flag = ''
+        if higherIsBetter is not None and worse > threshold:
+            flag = '  REGRESSED'
+            regressed.append(name)
+        print('%-48s %10.2f %10.2f %+7.1f%%%s' % (name, before, value, change * 100, flag))
+    return regressed
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the hot paths in TangentBridge')
+    parser.add_argument('-k', dest='only', action='append', metavar='NAME',
+            help='run only benchmarks whose names contain NAME (may be repeated)')
+    parser.add_argument('--json', metavar='FILE', help='save the results to FILE')
+    parser.add_argument('--compare', metavar='FILE', help='compare with results saved earlier; exit 1 on a regression')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+            help='fraction by which a result may be worse than before (default %g)' % THRESHOLD)
+    args = parser.parse_args()
+    for b in BENCHMARKS:
+        if not args.only or any([ k in b.__name__ for k in args.only ]):
+            b()
+    if args.json:
+        save(args.json)
+    if args.compare:
+        regressed = compare(args.compare, args.threshold)
+        if regressed:
+            print('%d regressed by more than %g%%' % (len(regressed), args.threshold * 100))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
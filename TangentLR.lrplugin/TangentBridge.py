@@ -1,21 +1,33 @@
 #!/usr/bin/env python
 # Written to work on both Python 2 and 3 (OSX provides 2.7)
 
+from array import array
 import binascii
+import collections
+import errno
+import logging
+import logging.handlers
 import os
 import select
+import signal
 import socket
 import struct
 import sys
+import threading
+import time
 if sys.version_info[0] < 3:
-    import Queue
     PYTHON3=False
+    import Queue as queue
 else:
-    import queue as Queue
     PYTHON3=True
+    import queue
+try:
+    from time import monotonic
+except ImportError: # python 2
+    from time import time as monotonic
 
-from TangentMapping import ALL_MENUS
-import TangentMappingDefinitions
+from TangentMapping import Menu, Parameter, mode_parameters
+import TangentMapping
 
 TANGENT_PORT = 64246
 # of course, lrsend and lrecv ports are the opposite way round to what's in the lua side
@@ -24,30 +36,194 @@ LRRECV_PORT = 54779
 
 APPNAME = 'Adobe Lightroom Classic'
 
+# Parameter changes from the Tangent are coalesced per control for this long (seconds)
+# before being forwarded to LR; only the latest value for each control is sent.
+# 0 means "at the end of each pass of the main loop".
+COALESCE_WINDOW = 0.02
+
+# Transport ring (jog) steps are added up until the ring has been still for JOG_SETTLE seconds,
+# then sent to LR as a single StepPhoto command. While the ring keeps turning, the steps so far
+# are sent at most once every JOG_INTERVAL seconds, so the filmstrip can keep up.
+# (None: only send when the ring settles.)
+JOG_SETTLE = 0.15
+JOG_INTERVAL = 0.5
+
+# How many GetValue requests may be outstanding to LR at once,
+# and how long to wait for an answer before giving up on one (seconds)
+LR_REQUEST_WINDOW = 4
+LR_REQUEST_TIMEOUT = 1.0
+
+# After we write a value to LR, values LR sends for that parameter are taken to be echoes of
+# earlier writes, and ignored, until it echoes the latest one or this long has passed (seconds)
+LR_ECHO_TIMEOUT = 1.0
+
+# Tangent reads of a value we set or heard from LR less than this long ago (seconds)
+# are answered from VALUES, without asking LR
+VALUE_TTL = 2.0
+
+# LR commands which change the current photo, and so make all our values stale
+PHOTO_CHANGES = frozenset(['Prev', 'Next', 'Select1Left', 'Select1Right', 'StepPhoto'])
+
+# On a mode change, ask LR for every parameter the new mode shows, rather than waiting for the Hub to ask
+PREFETCH_ON_MODE_CHANGE = True
+
+# Value updates from LR for the Tangent are dropped if the display already shows the value to within
+# less than this many of the parameter's StepSize (0: only drop exact repeats). Values worked out
+# from the panel's own input are always sent.
+DISPLAY_EPSILON_STEPS = 1.0
+
+# The Tangent displays can't usefully refresh faster than this (Hz). Value updates from LR are
+# held and sent at most this often, latest value wins. The control being turned right now,
+# answers to the Hub's reads and the first fill after a mode change are sent straight away.
+DISPLAY_MAX_RATE = 30
+
+# Custom parameters (not in controls.xml) get value slots of their own, up to this many.
+# When they are all taken, the one least recently set is recycled.
+CUSTOM_SLOTS = 64
+
+# Latency tracking (see LatencyTracker). Stage timestamps older than this (seconds) are assumed
+# to belong to a message that was lost or merged, and are not counted.
+LATENCY_MAX_AGE = 5.0
+
+# How much to read from a socket at once
+RECV_SIZE = 65536
+
+# Output buffer watermarks (bytes). When either the Tangent or LR output buffer goes over the
+# high watermark, we stop reading from the Tangent until both have drained below the low watermark.
+WRITE_HIGH_WATER = 64*1024
+WRITE_LOW_WATER = 16*1024
+
+# When a connection to the Hub or LR fails or is lost, we try again after RECONNECT_MIN seconds,
+# doubling the wait each time up to RECONNECT_MAX. If an endpoint stays away for longer than
+# RECONNECT_GIVE_UP seconds, we exit.
+RECONNECT_MIN = 0.25
+RECONNECT_MAX = 8.0
+RECONNECT_GIVE_UP = 60.0
+
+# Logging. Per-packet messages are at DEBUG; at the default INFO they cost next to nothing.
+# The latest LOG_RING_SIZE records are kept in memory and can be dumped at any time
+# (send the bridge SIGUSR1). The log file is written by a background thread and rotated
+# at LOG_FILE_BYTES, keeping LOG_FILE_COUNT old files.
+LOG_LEVEL = logging.INFO
+LOG_FILE = 'TangentBridge.log' # relative to the plugin dir
+LOG_DUMP_FILE = 'TangentBridge-dump.log'
+LOG_FILE_BYTES = 1024*1024
+LOG_FILE_COUNT = 3
+LOG_RING_SIZE = 2000
+LOG_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+
+log = logging.getLogger('TangentBridge')
+log.addHandler(logging.NullHandler()) # silent until setupLogging is called
+
+class RingHandler(logging.Handler):
+    ''' Keeps the most recent log records in memory; they are only formatted when dumped '''
+    def __init__(self, capacity=LOG_RING_SIZE):
+        logging.Handler.__init__(self)
+        self.records = collections.deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def dump(self, stream):
+        for record in list(self.records):
+            stream.write(self.format(record) + '\n')
+
+class BackgroundHandler(logging.Handler):
+    ''' Hands records to another handler on a thread of its own, so a slow disk never holds up the main loop '''
+    def __init__(self, target):
+        logging.Handler.__init__(self)
+        self.target = target
+        self.queue = queue.Queue()
+        self.thread = threading.Thread(target=self.drain, name='log writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def emit(self, record):
+        self.queue.put(record)
+
+    def drain(self):
+        while True:
+            record = self.queue.get()
+            if record is None:
+                return
+            self.target.handle(record)
+
+    def close(self):
+        ''' Writes out everything queued so far, then stops the thread '''
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.target.close()
+        logging.Handler.close(self)
+
+def setupLogging(level=LOG_LEVEL, filename=None, console=False):
+    '''
+    Sends our log to a ring buffer, to a rotating file if filename is given, and to stdout
+    if console is set. Replaces (and closes) whatever was set up before.
+    '''
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [ RingHandler() ]
+    problem = None
+    if filename:
+        try:
+            handlers.append(BackgroundHandler(logging.handlers.RotatingFileHandler(
+                filename, maxBytes=LOG_FILE_BYTES, backupCount=LOG_FILE_COUNT)))
+        except (IOError, OSError) as e:
+            problem = e
+    if console:
+        handlers.append(logging.StreamHandler(sys.stdout))
+    for h in list(log.handlers):
+        log.removeHandler(h)
+        h.close()
+    for h in handlers:
+        h.setFormatter(formatter)
+        log.addHandler(h)
+    log.setLevel(level)
+    log.propagate = False
+    if problem:
+        log.warning('Cannot write log file %s (%s)', filename, problem)
+
+def dumpLog(filename):
+    ''' Writes out the records held in the ring buffer '''
+    with open(filename, 'w') as f:
+        for h in log.handlers:
+            if isinstance(h, RingHandler):
+                h.dump(f)
+    log.info('Log ring dumped to %s', filename)
+
 def connect(port, address='127.0.0.1'):
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # Everything we send is small and latency-sensitive; we do our own batching (see Connection)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
     sock.connect((address,port))
     return sock
 
+# Precompiled codecs for the Tangent wire format (all big-endian)
+INT = struct.Struct('>i')
+FLOAT = struct.Struct('>f')
+INT_INT = struct.Struct('>ii')
+INT_FLOAT = struct.Struct('>if')
+
 # Packet wrangling syntactic sugar
 def rd4(seq, pos=0):
-    return struct.unpack(">i", seq[pos:pos+4])[0]
+    return INT.unpack_from(seq, pos)[0]
 def rd4f(seq, pos=0):
-    return struct.unpack(">f", seq[pos:pos+4])[0]
-def rd4multi(seq, pos, n):
-    return [ rd4(seq, pos*i+4) for i in range(n)]
+    return FLOAT.unpack_from(seq, pos)[0]
 def u4(i):
-    return bytearray(struct.pack('>i', i))
+    return bytearray(INT.pack(i))
 def rdstr(seq,pos):
     # returns (string, how far to advance the stream)
     length = rd4(seq,pos)
-    return seq[pos+4:pos+4+length], 4+length
+    s = bytes(bytearray(seq[pos+4:pos+4+length]))
+    if PYTHON3:
+        s = s.decode('utf-8')
+    return s, 4+length
 def encstr(s):
     if type(s) is str and PYTHON3:
         s = bytes(s, 'utf-8')
     return u4(len(s)) + s
 def encf(f):
-    return bytearray(struct.pack('>f', f))
+    return bytearray(FLOAT.pack(f))
 
 def split(seq, length=4):
     ''' splits data into words '''
@@ -56,6 +232,312 @@ def hexdump(seq, length=4):
     ''' dumps data as words, for debug '''
     return [(binascii.hexlify(x)) for x in split(seq,length)]
 
+class FrameDecoder(object):
+    '''
+    Reassembles length-prefixed Tangent frames from a byte stream.
+    A socket read may return part of a frame, or several frames at once;
+    any incomplete frame is held over until the rest of it arrives.
+    '''
+    def __init__(self):
+        self.buf = bytearray()
+
+    def feed(self, data):
+        '''
+        Adds data read from the socket; returns a list of all frames now complete.
+        Frames are memoryviews onto a single copy of the data, without their length words.
+        '''
+        buf = self.buf
+        buf += data
+        bounds = []
+        pos = 0
+        end = len(buf)
+        while end - pos >= 4:
+            dlen = rd4(buf, pos)
+            if dlen < 0:
+                raise ValueError('Bad Tangent frame length %d'%dlen)
+            if end - pos - 4 < dlen:
+                break
+            bounds.append((pos+4, pos+4+dlen))
+            pos += 4+dlen
+        if not pos:
+            return []
+        complete = memoryview(bytes(buf[:pos]))
+        del buf[:pos]
+        return [ complete[a:b] for a,b in bounds ]
+
+class LineDecoder(object):
+    '''
+    Reassembles newline-terminated MIDI2LR messages from a byte stream.
+    Only complete lines are returned; a partial line is held over until the rest of it arrives.
+    '''
+    def __init__(self):
+        self.buf = bytearray()
+
+    def feed(self, data):
+        ''' Adds data read from the socket; returns a list of all lines now complete (without their newlines) '''
+        buf = self.buf
+        buf += data
+        end = buf.rfind(b'\n')
+        if end < 0:
+            return []
+        lines = bytes(buf[:end]).split(b'\n')
+        del buf[:end+1]
+        return lines
+
+class Connection(object):
+    '''
+    A non-blocking socket with an output buffer.
+    Writes only append to the buffer; the main loop flushes each connection once per pass,
+    so everything produced while handling a batch of input goes out in a single send.
+    Whatever the kernel won't take right now is kept, and sent when the socket is writable.
+    A Connection outlives its socket: while disconnected, anything written to it is dropped.
+    '''
+    def __init__(self, name, sock=None):
+        self.name = name
+        self.sock = None
+        self.wbuf = bytearray()
+        if sock is not None:
+            self.attach(sock)
+
+    def attach(self, sock):
+        self.sock = sock
+        self.sock.setblocking(False)
+        del self.wbuf[:]
+
+    def connected(self):
+        return self.sock is not None
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def recv(self, size):
+        return self.sock.recv(size)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        del self.wbuf[:]
+
+    def pending(self):
+        ''' Returns the number of bytes waiting to be sent '''
+        return len(self.wbuf)
+
+    def write(self, data):
+        if self.sock is not None:
+            self.wbuf += data
+
+    def flush(self):
+        ''' Sends as much buffered output as the socket will take '''
+        if not self.wbuf:
+            return
+        try:
+            sent = self.sock.send(self.wbuf)
+        except socket.error as e:
+            if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            raise
+        del self.wbuf[:sent]
+
+class Capture(object):
+    '''
+    Records everything the bridge sends and receives, for replay by TangentReplay.py.
+    The file starts with MAGIC, then has one record per Tangent frame (without its length word)
+    or LR line (without its newline): kind, microseconds since the previous record, length, data.
+    '''
+    MAGIC = b'TangentLR capture 1\n'
+    RECORD = struct.Struct('>BII')
+    TANGENT_IN, TANGENT_OUT, LR_IN, LR_OUT = range(4)
+    KINDS = ['Tangent in', 'Tangent out', 'LR in', 'LR out']
+
+    def __init__(self, filename):
+        self.file = open(filename, 'wb')
+        self.file.write(self.MAGIC)
+        self.last = monotonic()
+        self.records = 0
+
+    def record(self, kind, data, when=None):
+        if when is None:
+            when = monotonic()
+        delta = int((when - self.last) * 1e6)
+        if delta > 0:
+            self.last += delta / 1e6
+        else:
+            delta = 0 # things handled out of arrival order keep their place
+        data = bytes(bytearray(data)) # frames may be memoryviews
+        self.file.write(self.RECORD.pack(kind, min(delta, 0xffffffff), len(data)))
+        self.file.write(data)
+        self.records += 1
+
+    def close(self):
+        self.file.close()
+
+def readCapture(filename):
+    ''' Yields (kind, seconds since the start, data) for each record in a Capture file '''
+    with open(filename, 'rb') as f:
+        if f.read(len(Capture.MAGIC)) != Capture.MAGIC:
+            raise ValueError('%s is not a TangentLR capture' % filename)
+        size = Capture.RECORD.size
+        when = 0
+        while True:
+            header = f.read(size)
+            if len(header) < size:
+                return
+            kind, delta, length = Capture.RECORD.unpack(header)
+            when += delta
+            yield kind, when / 1e6, f.read(length)
+
+class RequestPipeline(object):
+    '''
+    Tracks GetValue requests to LR. At most `window` are outstanding at once; the rest wait their turn.
+    Asking for a value that is already waiting or outstanding does nothing more.
+    Any value message from LR for a name completes the outstanding request for it and lets the next one go.
+    '''
+    def __init__(self, send, window):
+        self.send = send # function taking a name
+        self.window = window
+        self.waiting = collections.OrderedDict() # name -> None, in order of asking
+        self.inflight = {} # name -> time sent
+        self.merged = 0 # duplicate requests
+        self.expired = 0 # requests that got no answer in time
+
+    def request(self, name):
+        if name in self.inflight or name in self.waiting:
+            self.merged += 1
+            return
+        self.waiting[name] = None
+        self.pump()
+
+    def answered(self, name):
+        if self.inflight.pop(name, None) is not None:
+            self.pump()
+
+    def expire(self, timeout):
+        ''' Gives up on requests outstanding for longer than timeout, so they don't block the window '''
+        cutoff = monotonic() - timeout
+        for name,sent in list(self.inflight.items()):
+            if sent <= cutoff:
+                del self.inflight[name]
+                self.expired += 1
+        self.pump()
+
+    def requeue(self):
+        ''' Asks again for everything outstanding, ahead of anything waiting; for when the connection to LR was lost '''
+        waiting = collections.OrderedDict([ (name, None) for name in sorted(self.inflight, key=self.inflight.get) ])
+        waiting.update(self.waiting)
+        self.inflight = {}
+        self.waiting = waiting
+        self.pump()
+
+    def pump(self):
+        while self.waiting and len(self.inflight) < self.window:
+            name,_ = self.waiting.popitem(last=False)
+            self.inflight[name] = monotonic()
+            self.send(name)
+
+class LatencyHistogram(object):
+    '''
+    Log-linear histogram of latencies, in the style of HdrHistogram: buckets are linear within each
+    power of two, so every value is held to within 1/HALF (~3%) whatever its size.
+    Recording is a couple of integer operations; nothing is sorted or stored per sample.
+    '''
+    SUB_BITS = 6
+    SUB_BUCKETS = 1 << SUB_BITS
+    HALF = SUB_BUCKETS >> 1
+    MAX_SHIFT = 32 # values up to about 2**38 microseconds (3 days) are counted; longer ones are clamped
+
+    def __init__(self):
+        self.counts = [0] * ((self.MAX_SHIFT + 1) * self.HALF + self.HALF)
+        self.total = 0
+        self.max = 0
+
+    def record(self, seconds):
+        us = int(seconds * 1e6)
+        if us < 0:
+            us = 0
+        if us < self.SUB_BUCKETS:
+            index = us
+        else:
+            shift = us.bit_length() - self.SUB_BITS
+            if shift > self.MAX_SHIFT:
+                shift = self.MAX_SHIFT
+                us = (self.SUB_BUCKETS << shift) - 1
+            index = shift * self.HALF + (us >> shift)
+        self.counts[index] += 1
+        self.total += 1
+        if us > self.max:
+            self.max = us
+
+    def bucketTop(self, index):
+        ''' The highest value (microseconds) counted in a bucket '''
+        if index < self.SUB_BUCKETS:
+            return index
+        shift = index // self.HALF - 1
+        return ((index - shift * self.HALF + 1) << shift) - 1
+
+    def percentile(self, p):
+        ''' Returns the pth percentile in seconds (0 if nothing recorded) '''
+        if not self.total:
+            return 0.0
+        wanted = max(1, int(self.total * p / 100.0 + 0.5))
+        seen = 0
+        for index,count in enumerate(self.counts):
+            seen += count
+            if seen >= wanted:
+                return min(self.bucketTop(index), self.max) / 1e6
+        return self.max / 1e6
+
+    def summary(self):
+        if not self.total:
+            return 'no samples'
+        return 'p50 %.1fms, p95 %.1fms, p99 %.1fms, max %.1fms over %d' % (
+            self.percentile(50)*1000, self.percentile(95)*1000, self.percentile(99)*1000, self.max/1000.0, self.total)
+
+class LatencyTracker(object):
+    '''
+    Follows each control through the bridge and keeps a LatencyHistogram per stage:
+        toLR:      dial tick arrives from the Tangent -> its value is written to LR (includes coalescing)
+        roundTrip: value written to LR -> LR echoes the parameter back
+        toPanel:   a value arrives from LR -> it's sent to the Tangent display (includes rate limiting)
+    Stages are keyed the same way as VALUES: control ID, or name for custom parameters.
+    Where several ticks are merged into one write, the earliest tick is counted.
+    '''
+    def __init__(self):
+        self.toLR = LatencyHistogram()
+        self.roundTrip = LatencyHistogram()
+        self.toPanel = LatencyHistogram()
+        self.ticked = {} # key -> when the earliest tick not yet written to LR arrived
+        self.written = {} # key -> when its value was last written to LR
+        self.echoed = {} # key -> when LR's latest value for it arrived
+
+    def tick(self, key, now):
+        if key not in self.ticked:
+            self.ticked[key] = now
+
+    def wrote(self, key, now):
+        start = self.ticked.pop(key, None)
+        if start is not None:
+            self.toLR.record(now - start)
+            self.written[key] = now
+
+    def echo(self, key, now):
+        start = self.written.pop(key, None)
+        if start is not None and now - start < LATENCY_MAX_AGE:
+            self.roundTrip.record(now - start)
+        self.echoed[key] = now
+
+    def displayed(self, key, now):
+        start = self.echoed.pop(key, None)
+        if start is not None and now - start < LATENCY_MAX_AGE:
+            self.toPanel.record(now - start)
+
+    def suppressed(self, key):
+        ''' The display already showed LR's value, so there's nothing to time '''
+        self.echoed.pop(key, None)
+
+    def report(self):
+        return [ ('Tangent->LR', self.toLR), ('LR round trip', self.roundTrip), ('LR->panel', self.toPanel) ]
+
 ##############################################################
 
 # Mapping from control IDs (defined in controls.xml) to LR parameters (strings the plugin is expecting)
@@ -81,43 +563,239 @@ class Control(object):
     def id_for(name):
         return Control.by_name[name].id
 
+def load_controls():
+    '''
+    Returns (ControlsFile, mode ID -> list of parameter IDs shown by that mode, where they came from).
+    These come from the table precompiled by the generator if it's up to date ('table'); if not, from
+    building the definitions themselves, which takes longer, and then the table is written for next
+    time (and where they came from says how that went).
+    '''
+    directory = os.path.dirname(os.path.abspath(__file__))
+    filename = os.path.join(directory, TangentMapping.TABLE_FILE)
+    table = TangentMapping.read_table(filename)
+    if table:
+        return table + ('table',)
+    # The definitions report what they build on stdout, which is for the generator, not us
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        import TangentMappingDefinitions as defs
+        # We don't know which panels are connected, so take every map into account
+        modeParameters = mode_parameters(defs.controls, defs.all_maps())
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    try:
+        # so that next time is quicker
+        TangentMapping.write_table(filename, defs.controls, modeParameters)
+        source = 'the definitions; wrote %s' % filename
+    except (IOError, OSError) as e:
+        source = 'the definitions; cannot write %s (%s)' % (filename, e)
+    return defs.controls, modeParameters, source
+
+CONTROLS, MODE_PARAMETERS, CONTROLS_SOURCE = load_controls()
+
 ALL_CONTROLS = []
-for group in TangentMappingDefinitions.controls.groups:
+for group in CONTROLS.groups:
     for ctrl in group.controls:
         ALL_CONTROLS.append(Control(ctrl.id, ctrl.Name, ctrl.MinValue, ctrl.MaxValue))
 
-# Current values, indexed by ID [for now]
-VALUES = {}
+class ValueTable(object):
+    '''
+    Current parameter values, held in flat arrays indexed by a dense slot number.
+    Slots 0..n-1 are the Parameters in the controls file, in order, with their ranges and step sizes;
+    after them come CUSTOM_SLOTS slots for custom parameters, assigned by name as they are first seen
+    (and taken back from the least recently set, once they are all in use).
+    A slot holds NaN until its value is known, and records when it was last set (see fresh()).
+    Supports enough of the dict interface (in, [], []=) to be indexed by control ID or custom name.
+    '''
+    def __init__(self, parameters, customSlots=CUSTOM_SLOTS):
+        self.keys = [ p.id for p in parameters ] # slot -> control ID or custom name
+        self.slot = dict([ (k,i) for i,k in enumerate(self.keys) ]) # the reverse
+        self.parameters = len(self.keys) # slots below this are Parameters
+        self.custom = collections.OrderedDict() # custom name -> slot, least recently set first
+        self.size = len(self.keys) + customSlots
+        nan, inf = float('nan'), float('inf')
+        self.values = array('d', [nan]) * self.size
+        self.minimum = array('d', [ p.MinValue for p in parameters ] + [-inf] * customSlots)
+        self.maximum = array('d', [ p.MaxValue for p in parameters ] + [inf] * customSlots)
+        self.step = array('d', [ p.StepSize for p in parameters ] + [0] * customSlots)
+        self.stamps = array('d', [0]) * self.size
+        self.shown = array('d', [nan]) * self.size # what the Tangent is displaying, see show()
+        self.recycled = 0 # custom slots taken back for another name
+
+    def allocate(self, key):
+        ''' Assigns a custom slot to key, recycling the least recently set if they're all taken '''
+        if len(self.keys) < self.size:
+            i = len(self.keys)
+            self.keys.append(key)
+        else:
+            old, i = self.custom.popitem(last=False)
+            del self.slot[old]
+            self.keys[i] = key
+            self.values[i] = self.shown[i] = float('nan')
+            self.stamps[i] = 0
+            self.recycled += 1
+        self.slot[key] = i
+        self.custom[key] = i
+        return i
+
+    def __contains__(self, key):
+        i = self.slot.get(key)
+        return i is not None and self.values[i] == self.values[i] # i.e. not NaN
+
+    def __getitem__(self, key):
+        v = self.values[self.slot[key]]
+        if v != v:
+            raise KeyError(key)
+        return v
+
+    def __setitem__(self, key, value):
+        i = self.slot.get(key)
+        if i is None:
+            i = self.allocate(key)
+        elif i >= self.parameters:
+            del self.custom[key] # to the back of the queue for recycling
+            self.custom[key] = i
+        self.values[i] = value
+        self.stamps[i] = monotonic()
+
+    def add(self, key, incr, default):
+        '''
+        Adds incr to the value for key (or to default, if not yet known) and clamps it to range.
+        Returns (new value, whether the value was known).
+        '''
+        i = self.slot[key]
+        values = self.values
+        v = values[i]
+        known = v == v
+        if not known:
+            v = default
+        v += incr
+        if v > self.maximum[i]:
+            v = self.maximum[i]
+        elif v < self.minimum[i]:
+            v = self.minimum[i]
+        values[i] = v
+        self.stamps[i] = monotonic()
+        return v, known
 
-ALL_MODES = TangentMappingDefinitions.controls.modes
+    def fresh(self, key, ttl):
+        ''' Is the value for key known, and set within the last ttl seconds? '''
+        i = self.slot.get(key)
+        return i is not None and monotonic() - self.stamps[i] < ttl and self.values[i] == self.values[i]
+
+    def same(self, key, a, b):
+        ''' Are a and b the same value for key, to within half its StepSize? '''
+        i = self.slot.get(key)
+        step = self.step[i] if i is not None else 0
+        return abs(a - b) <= max(step / 2, 1e-9)
+
+    def show(self, key, value, steps, force=False):
+        '''
+        Records that value is to be displayed for key.
+        Unless force is set, returns False (and records nothing) if the display already shows it,
+        to within less than steps * StepSize.
+        '''
+        i = self.slot.get(key)
+        if i is None:
+            return True
+        d = abs(value - self.shown[i])
+        if not force and (d == 0 or d < self.step[i] * steps): # always False for NaN
+            return False
+        self.shown[i] = value
+        return True
+
+    def forgetShown(self):
+        ''' Forgets what the Tangent displays, e.g. because it changed mode '''
+        self.shown = array('d', [float('nan')]) * self.size
+
+    def invalidate(self):
+        ''' Marks all values stale (but keeps them) '''
+        self.stamps = array('d', [0]) * self.size
+
+    def dump(self, filename):
+        ''' Writes all values to a file as raw native doubles, in slot order (see keys) '''
+        with open(filename, 'wb') as f:
+            self.values.tofile(f)
+
+# Current values, indexed by control ID (or name, for custom parameters)
+VALUES = ValueTable([ ctrl for group in CONTROLS.groups
+                           for ctrl in group.controls if isinstance(ctrl, Parameter) ])
+
+ALL_MODES = CONTROLS.modes
+
+# Menu control ID -> Menu
+MENUS = dict([ (ctrl.id, ctrl) for group in CONTROLS.groups for ctrl in group.controls if isinstance(ctrl, Menu) ])
 
 ##############################################################
 
 class Bridge(object):
-    def __init__(self, pluginPath):
+    ENDPOINTS = [ 'Tangent', 'LRSend', 'LRRecv' ] # Connection attributes, in the same order as self.ports
+
+    def __init__(self, pluginPath, tangentPort=TANGENT_PORT, lrSendPort=LRSEND_PORT, lrRecvPort=LRRECV_PORT, capture=None):
         self.pluginInfo = pluginPath
         self.pluginDir = os.path.abspath(os.path.dirname(pluginPath))
+        self.ports = (tangentPort, lrSendPort, lrRecvPort)
         # Initialise these first in case connection fails
         self.Tangent = None
         self.LRSend = None
         self.LRRecv = None
-        self.lrQueue = Queue.Queue()
-        self.lrSendInProgress= False
+        self.tangentFrames = FrameDecoder()
+        self.lrLines = LineDecoder()
+        self.lrLinesPerRecv = collections.Counter() # number of lines -> how many reads carried that many
+        self.lrRequests = RequestPipeline(self.sendGetValue, LR_REQUEST_WINDOW)
+        self.cacheHits = 0 # Tangent reads answered from VALUES
+        self.cacheMisses = 0 # ... and passed on to LR
+        self.populating = set() # parameters of the current mode not yet sent to the Tangent
+        self.populateStart = 0
+        self.populateTimes = [] # seconds from each mode change until all its parameters were shown
+        self.hubAsked = set() # parameters the Tangent has asked for, which we must answer even if unchanged
+        self.displayPending = collections.OrderedDict() # param -> value, see displayValue
+        self.customPending = collections.OrderedDict() # custom name -> value
+        self.activeControl = None # the param or custom name most recently turned on the Tangent
+        self.displayForwarded = 0
+        self.displaySuppressed = 0
+        self.latency = LatencyTracker()
+        self.tangentReceived = monotonic() # when the data being handled arrived
+        self.lrReceived = monotonic()
+        self.lrPending = collections.OrderedDict() # param -> latest value, see sendLRCoalesced
+        self.lrWritten = {} # param -> (latest value written to LR, when), until LR echoes it; see staleFromLR
+        self.timers = {} # name -> (deadline, function)
+        self.throttled = False # see WRITE_HIGH_WATER
+        self.jogPending = 0 # net photo steps not yet sent, see onTransport
+        self.jogStarted = 0 # when the first of them arrived
+        self.jogLast = 0 # when the latest of them arrived
         self.udsm = 0
-        self.log('Starting up, plugin dir is %s'%self.pluginDir)
+        self.mode = None # the current mode's ID, once the Tangent has one
+        self.modeIndex = 0
+        self.backoff = {} # endpoint -> how long to wait before the next reconnect attempt
+        self.downSince = {} # endpoint -> when it was lost (or first tried)
+        self.reconnects = collections.Counter() # endpoint -> times it came back
+        self.halt = False
+        self.dumpFile = None # see dumpOnSignal
+        self.dumpRequested = False
+        self.wakeup = None # (receiving, sending) socket pair that signals wake the main loop with
+        self.capture = None
+        log.info('Starting up, plugin dir is %s', self.pluginDir)
+        if CONTROLS_SOURCE != 'table':
+            log.info('Control table %s was missing or out of date; loaded controls from %s', TangentMapping.TABLE_FILE, CONTROLS_SOURCE)
+        if capture:
+            self.capture = Capture(capture)
+            log.info('Capturing traffic to %s', capture)
         self.connectAll()
 
     def __del__(self):
         self.closeAll()
 
     def connectAll(self):
+        ''' Makes the first attempt to connect each endpoint; those that fail are retried, see reconnect() '''
         self.closeAll()
-        self.Tangent = connect(TANGENT_PORT)
-        self.Tangent.setblocking(False)
-        self.LRSend = connect(LRSEND_PORT)
-        self.LRSend.setblocking(False)
-        self.LRRecv = connect(LRRECV_PORT)
-        self.LRRecv.setblocking(False)
+        self.Tangent = Connection('Tangent')
+        self.LRSend = Connection('LR send')
+        self.LRRecv = Connection('LR receive')
+        for which in self.ENDPOINTS:
+            self.reconnect(which)
 
     def closeAll(self):
         if self.Tangent:
@@ -127,25 +805,171 @@ class Bridge(object):
         if self.LRRecv:
             self.LRRecv.close()
 
-    def log(self, msg):
-        print(msg)
-        # TODO: write to logfile?
+    # -----------------------------------------------------------------
+    # Reconnection. Each endpoint comes and goes independently; everything else we know
+    # (VALUES, the mode, menu settings) is kept, and the panel is put back when the Hub returns.
+
+    def reconnect(self, which):
+        ''' Tries to connect an endpoint. If that fails, tries again later, backing off exponentially. '''
+        conn = getattr(self, which)
+        port = self.ports[self.ENDPOINTS.index(which)]
+        try:
+            conn.attach(connect(port))
+        except socket.error as e:
+            down = monotonic() - self.downSince.setdefault(which, monotonic())
+            if down > RECONNECT_GIVE_UP:
+                log.error('%s: no connection on port %d for %.0fs (%s); giving up', conn.name, port, down, e)
+                self.halt = True
+                return
+            delay = self.backoff.get(which, RECONNECT_MIN)
+            self.backoff[which] = min(delay * 2, RECONNECT_MAX)
+            log.info('%s: cannot connect on port %d (%s); retrying in %.2fs', conn.name, port, e, delay)
+            self.schedule('connect ' + which, delay, lambda: self.reconnect(which))
+            return
+        if which in self.downSince:
+            self.reconnects[which] += 1
+        self.backoff.pop(which, None)
+        self.downSince.pop(which, None)
+        log.info('%s connected on port %d', conn.name, port)
+        if which != 'Tangent':
+            # Whatever we asked LR for while it was away went nowhere
+            self.lrRequests.requeue()
+            self.lrWritten.clear()
+        # When the Hub is back it sends Initiate Comms, and we restore the panel then (see onInitiateComms)
+
+    def disconnected(self, which, reason):
+        ''' An endpoint has gone away: forget what was in transit on it, and start reconnecting '''
+        conn = getattr(self, which)
+        log.warning('%s connection lost (%s); reconnecting', conn.name, reason)
+        conn.close()
+        if which == 'Tangent':
+            self.tangentFrames = FrameDecoder()
+            self.displayPending.clear()
+            self.customPending.clear()
+            self.hubAsked.clear()
+            self.populating = set()
+            self.activeControl = None
+            self.throttled = False
+        elif which == 'LRRecv':
+            self.lrLines = LineDecoder()
+        self.downSince[which] = monotonic()
+        self.reconnect(which)
+
+    def resyncPanel(self):
+        ''' Puts a reconnected panel back as it was: the current mode, and every value we have for it '''
+        log.info('Restoring mode %08x on the Tangent', self.mode)
+        self.changeMode(self.mode, resync=True)
+
+    # -----------------------------------------------------------------
+    # Timers
+
+    def schedule(self, name, delay, fn):
+        ''' Arranges for fn to be called in delay seconds, unless a timer with this name is already pending. '''
+        if name not in self.timers:
+            self.timers[name] = (monotonic() + delay, fn)
+
+    def nextTimeout(self):
+        ''' Returns how long the main loop may sleep for (None if forever) '''
+        if not self.timers:
+            return None
+        return max(0, min([t[0] for t in self.timers.values()]) - monotonic())
+
+    def runTimers(self):
+        now = monotonic()
+        for name,(deadline,fn) in list(self.timers.items()):
+            if deadline <= now:
+                del self.timers[name]
+                fn()
 
     # -----------------------------------------------------------------
     # Tangent logic
 
     def sendTangent(self, pkt):
         ''' Sends a Tangent packet. This function takes care of sending the length word. '''
-        s = self.Tangent
-        s.sendall(u4(len(pkt)))
-        pkt = bytearray(pkt)
-        s.sendall(pkt)
+        self.Tangent.write(u4(len(pkt)) + pkt)
+        if self.capture:
+            self.capture.record(Capture.TANGENT_OUT, pkt)
+
+    def displayValue(self, param, value, force=False):
+        ''' Updates a parameter value on the Tangent display, subject to DISPLAY_MAX_RATE '''
+        if force or param == self.activeControl or param in self.populating:
+            self.displayPending.pop(param, None)
+            self.sendValue(param, value, force)
+        else:
+            self.displayPending[param] = value
+            self.schedule('display', 1.0/DISPLAY_MAX_RATE, self.flushDisplays)
+
+    def displayCustom(self, name, value, force=False):
+        ''' Updates a custom parameter value on the Tangent display, subject to DISPLAY_MAX_RATE '''
+        if force or name == self.activeControl:
+            self.customPending.pop(name, None)
+            self.sendCustom(name, value, force)
+        else:
+            self.customPending[name] = value
+            self.schedule('display', 1.0/DISPLAY_MAX_RATE, self.flushDisplays)
+
+    def flushDisplays(self):
+        pending, self.displayPending = self.displayPending, collections.OrderedDict()
+        for param,value in pending.items():
+            self.sendValue(param, value)
+        pending, self.customPending = self.customPending, collections.OrderedDict()
+        for name,value in pending.items():
+            self.sendCustom(name, value)
+
+    def sendValue(self, param, value, force=False):
+        '''
+        Sends a parameter value to the Tangent, unless it's already showing it (see DISPLAY_EPSILON_STEPS).
+        This suppresses LR's echoes of the latest change we made (older ones are dropped by staleFromLR),
+        and repeats of unchanged values.
+        '''
+        if VALUES.show(param, value, DISPLAY_EPSILON_STEPS, force):
+            self.displayForwarded += 1
+            self.sendTangent(u4(0x82) + u4(param) + encf(value) + u4(0))
+            self.latency.displayed(param, monotonic())
+        else:
+            self.displaySuppressed += 1
+            self.latency.suppressed(param)
+        if param in self.populating:
+            self.populating.discard(param)
+            if not self.populating:
+                elapsed = monotonic() - self.populateStart
+                self.populateTimes.append(elapsed)
+                log.info('Mode displays populated in %.1fms', elapsed*1000)
+
+    def sendCustom(self, name, value, force=False):
+        ''' Sends a custom parameter value to the Tangent, unless it's already showing it '''
+        if VALUES.show(name, value, DISPLAY_EPSILON_STEPS, force):
+            self.displayForwarded += 1
+            self.sendTangent(u4(0xa6) + encstr(name) + encf(value) + u4(0))
+            self.latency.displayed(name, monotonic())
+        else:
+            self.displaySuppressed += 1
+            self.latency.suppressed(name)
+
+    def prefetchMode(self, mode, ttl=VALUE_TTL):
+        '''
+        Asks LR for every value the mode shows, so they're ready before the Hub asks.
+        Values we set or heard less than ttl seconds ago (ttl None: any we have) are shown straight away instead.
+        '''
+        for param in MODE_PARAMETERS.get(mode, []):
+            if VALUES.fresh(param, ttl) if ttl is not None else param in VALUES:
+                self.displayValue(param, VALUES[param])
+            else:
+                self.requestLR(Control.by_id[param].name)
 
-    def changeMode(self, mode):
-        self.log('ChangeMode %08x'%mode)
+    def changeMode(self, mode, resync=False):
+        log.info('ChangeMode %08x', mode)
         self.sendTangent(u4(0x85) + u4(mode))
-        self.modeIndex = TangentMappingDefinitions.controls.find_mode_index(mode)
-        self.log('new index %d'%self.modeIndex)
+        self.mode = mode
+        VALUES.forgetShown()
+        self.populating = set(MODE_PARAMETERS.get(mode, []))
+        self.populateStart = monotonic()
+        if resync:
+            self.prefetchMode(mode, ttl=None)
+        elif PREFETCH_ON_MODE_CHANGE:
+            self.prefetchMode(mode)
+        self.modeIndex = CONTROLS.find_mode_index(mode)
+        log.debug('new index %d', self.modeIndex)
     def nextMode(self, step):
         prev = self.modeIndex
         self.modeIndex += step
@@ -154,154 +978,235 @@ class Bridge(object):
         if self.modeIndex < 0:
             self.modeIndex = len(ALL_MODES) - 1
         newMode = ALL_MODES[self.modeIndex]
-        self.log('NextMode index %d + %d --> index %d, id %08x'%(prev, step, self.modeIndex, newMode.id))
+        log.info('NextMode index %d + %d --> index %d, id %08x', prev, step, self.modeIndex, newMode.id)
         self.changeMode(newMode.id)
 
     def handleTangent(self, pkt):
         ''' Deal with a single Tangent command '''
         cmd = rd4(pkt)
-        if cmd==1:
-            protocol, npanels = rd4multi(pkt, 4, 2)
-            self.log('Tangent Initiate Comms: protocol %d, %d panels'%(protocol,npanels))
-            # We don't really care about the panel type data
-            self.sendTangent(u4(0x81) + encstr(APPNAME) + encstr(self.pluginDir) + encstr(''))
-            #self.sendLR('GetPluginInfo', 1)
+        handler = self.TANGENT_COMMANDS.get(cmd)
+        if handler is None:
+            log.warning('T< ??? (0x%x): %s', cmd, hexdump(bytes(bytearray(pkt[4:]))))
+            return
+        handler(self, pkt)
+
+    def onInitiateComms(self, pkt):
+        protocol, npanels = INT_INT.unpack_from(pkt, 4)
+        log.info('Tangent Initiate Comms: protocol %d, %d panels', protocol,npanels)
+        # We don't really care about the panel type data
+        self.sendTangent(u4(0x81) + encstr(APPNAME) + encstr(self.pluginDir) + encstr(''))
+        #self.sendLR('GetPluginInfo', 1)
+        if self.mode is None:
             # Initial Mode: Colour/Tone
             self.changeMode(1)
-            self.sendLR('SwToMdevelop', 1)
-
-        # Mode switching
-        elif cmd==9:
-            mode = rd4(pkt, 4)
-            self.log('CHANGE MODE: %08x'%mode)
-            self.changeMode(mode)
-            self.sendLR('SwToMdevelop', 1)
-
-        # Parameters. Note that these always range from 0 to 1 in midi2lr's world; it keeps a mapping.
-        elif cmd==2:
-            param,incr = rd4(pkt,4), rd4f(pkt,8)
-            if param & 0x40000000:
-                return self.encoderCustom(param, incr=incr)
-            control = Control.by_id[param]
-            name = control.name
-            if param not in VALUES:
-                VALUES[param]=0.5 # safeish default?
-                self.log('!!! no param for ' + name)
-                #self.sendLR('GetValue', name)
-            newvalue = VALUES[param] + incr
-            newvalue = max( min(newvalue, control.MaxValue), control.MinValue )
-            VALUES[param] = newvalue
-            self.log('T< Param Change: 0x%x (%s): %f -> %f'%(param,name,incr,newvalue))
-            self.sendLR(name, newvalue)
-        elif cmd==4:
-            param = rd4(pkt,4)
-            name = Control.name_for(param)
-            self.log('T< READ PARAM: 0x%x (%s)'%(param,name))
-            if param & 0x40000000:
-                return self.encoderCustom(param)
-            #self.log('>>> GetValue %s'%name)
-            self.sendLRQueued('GetValue', name)
-            # And the response will DTRT (--> 0x82)
-        elif cmd==3: # Reset param (knob pushed)
-            param = rd4(pkt,4)
-            name = Control.name_for(param)
-            self.log('T< RESET PARAM: 0x%x (%s)'%(param,name))
-            if param & 0x40000000:
-                return self.encoderCustom(param, reset=True)
-            self.sendLR('Reset'+name, '1')
-
-        # Custom Parameters.
-        elif cmd==0x36:
-            name,offset = rdstr(pkt, 4)
-            incr = rd4f(pkt, 4+offset)
-            self.log('T< CUSTOM PARAM: %s, %f'%(name,incr))
-            VALUES[name] += incr
-            self.log('T< Param Change: %s: %f -> %f'%(name,incr,VALUES[name]))
-            self.sendLR(name, VALUES[name])
-        elif cmd==0x37:
-            name,_ = rdstr(pkt, 4)
-            self.log('T< CUSTOM PARAM RESET: %s'%name)
-            self.sendLR('Reset'+name, '1')
-        elif cmd==0x38:
-            name,_ = rdstr(pkt, 4)
-            self.log('T< READ CUSTOM PARAM: %s'%name)
-            self.sendLRQueued('GetValue', name)
-            # And the response will DTRT (--> 0xa6)
-
-        # Button actions. We generally action on DOWN and ignore UP, but there are special cases.
-        elif cmd==8:
-            action = rd4(pkt,4)
-            if action & 0x40000000:
-                self.buttonCustom(action, up=False)
-                return
-            name = Control.name_for(action)
-            self.log('T< ACTION ON: 0x%x (%s)'%(action,name))
-            self.sendLR(name, '1')
-        elif cmd==0xb:
-            action = rd4(pkt,4)
-            if action & 0x40000000:
-                self.buttonCustom(action, up=True)
-                return
-            name = Control.name_for(action)
-            self.log('T< ACTION OFF: 0x%x (%s) (ignored)'%(action,name))
-        elif cmd==0x3c:
-            name,_ = rdstr(pkt, 4)
-            self.log('T< CUSTOM ACTION ON: %s'%name)
-            self.sendLR(name, '1')
-        elif cmd==0x3d:
-            name,_ = rdstr(pkt, 4)
-            self.log('T< CUSTOM ACTION OFF: %s'%name)
-
-
-        # Transport Ring. We use jog mode only.
-        elif cmd==0xa:
-            jog,shutl = rd4multi(pkt, 4, 2)
-            self.log('T< TRANSPORT: jog %d, shuttle %d'%(jog,shutl))
-            if jog<0:
-                for i in range(-jog):
-                    self.sendLR('Prev','1')
-            else:
-                for i in range(jog):
-                    self.sendLR('Next','1')
-
-        elif cmd==5:
-            id,incr = rd4multi(pkt, 4, 2)
-            display,verb = ALL_MENUS[id].change(incr)
-            self.log('T< MENU CHANGE: %08x, incr %d --> %s'%(id,incr,display))
-            self.log('>>> %s'%verb)
-            self.sendLR(verb, '1')
-            self.sendTangent(u4(0x83)+u4(id)+encstr(display)+u4(0))
-        elif cmd==6:
-            id = rd4(pkt, 4)
-            mnu = ALL_MENUS[id]
-            mnu.index = 0
-            display, verb = mnu.get()
-            self.log('T< MENU RESET: %08x --> %s'%(id,display))
-            self.log('>>> %s'%verb)
-            self.sendLR(verb, '1')
-            self.sendTangent(u4(0x83)+u4(id)+encstr(display)+u4(0))
-        elif cmd==7:
-            id = rd4(pkt, 4)
-            display, _= ALL_MENUS[id].get()
-            self.log('T< MENU STRING REQ: %08x --> %s'%(id,display))
-            self.sendTangent(u4(0x83)+u4(id)+encstr(display)+u4(0))
-
         else:
-            self.log('T< ??? (0x%x): %s'%(cmd, hexdump(pkt[4:])))
+            # The Hub has come back
+            self.resyncPanel()
+        self.sendLR('SwToMdevelop', 1)
+
+    # Mode switching
+    def onModeChange(self, pkt):
+        mode = rd4(pkt, 4)
+        log.debug('CHANGE MODE: %08x', mode)
+        self.changeMode(mode)
+        self.sendLR('SwToMdevelop', 1)
+
+    # Parameters. Note that these always range from 0 to 1 in midi2lr's world; it keeps a mapping.
+    def onParamChange(self, pkt):
+        param,incr = INT_FLOAT.unpack_from(pkt, 4)
+        if param & 0x40000000:
+            return self.encoderCustom(param, incr=incr)
+        name = Control.by_id[param].name
+        self.activeControl = param
+        self.latency.tick(param, self.tangentReceived)
+        newvalue, known = VALUES.add(param, incr, 0.5) # safeish default?
+        if not known:
+            log.debug('!!! no param for %s', name)
+            #self.sendLR('GetValue', name)
+        log.debug('T< Param Change: 0x%x (%s): %f -> %f', param,name,incr,newvalue)
+        self.sendLRCoalesced(name, newvalue)
+        self.displayValue(param, newvalue, force=True) # the panel's own change, so always shown
+
+    def onReadParam(self, pkt):
+        param = rd4(pkt,4)
+        name = Control.name_for(param)
+        log.debug('T< READ PARAM: 0x%x (%s)', param,name)
+        if param & 0x40000000:
+            return self.encoderCustom(param)
+        if VALUES.fresh(param, VALUE_TTL):
+            self.cacheHits += 1
+            self.displayValue(param, VALUES[param], force=True)
+            return
+        self.cacheMisses += 1
+        self.hubAsked.add(param)
+        #log.debug('>>> GetValue %s', name)
+        self.requestLR(name)
+        # And the response will DTRT (--> 0x82)
+
+    def onResetParam(self, pkt): # knob pushed
+        param = rd4(pkt,4)
+        name = Control.name_for(param)
+        log.debug('T< RESET PARAM: 0x%x (%s)', param,name)
+        if param & 0x40000000:
+            return self.encoderCustom(param, reset=True)
+        self.sendLR('Reset'+name, '1')
+
+    # Custom Parameters.
+    def onCustomParamChange(self, pkt):
+        name,offset = rdstr(pkt, 4)
+        incr = rd4f(pkt, 4+offset)
+        log.debug('T< CUSTOM PARAM: %s, %f', name,incr)
+        if name not in VALUES:
+            # We can't apply a change to a value we don't know; ask LR for it, so the next one works
+            log.info('Custom parameter %s changed before its value is known; asking LR', name)
+            self.requestLR(name)
+            return
+        self.activeControl = name
+        self.latency.tick(name, self.tangentReceived)
+        VALUES[name] += incr
+        log.debug('T< Param Change: %s: %f -> %f', name,incr,VALUES[name])
+        self.sendLRCoalesced(name, VALUES[name])
+        self.displayCustom(name, VALUES[name], force=True)
+
+    def onCustomParamReset(self, pkt):
+        name,_ = rdstr(pkt, 4)
+        log.debug('T< CUSTOM PARAM RESET: %s', name)
+        self.sendLR('Reset'+name, '1')
+
+    def onReadCustomParam(self, pkt):
+        name,_ = rdstr(pkt, 4)
+        log.debug('T< READ CUSTOM PARAM: %s', name)
+        if VALUES.fresh(name, VALUE_TTL):
+            self.cacheHits += 1
+            self.displayCustom(name, VALUES[name], force=True)
+            return
+        self.cacheMisses += 1
+        self.hubAsked.add(name)
+        self.requestLR(name)
+        # And the response will DTRT (--> 0xa6)
+
+    # Button actions. We generally action on DOWN and ignore UP, but there are special cases.
+    def onButtonDown(self, pkt):
+        action = rd4(pkt,4)
+        if action & 0x40000000:
+            self.buttonCustom(action, up=False)
+            return
+        name = Control.name_for(action)
+        log.debug('T< ACTION ON: 0x%x (%s)', action,name)
+        self.sendLR(name, '1')
+
+    def onButtonUp(self, pkt):
+        action = rd4(pkt,4)
+        if action & 0x40000000:
+            self.buttonCustom(action, up=True)
+            return
+        name = Control.name_for(action)
+        log.debug('T< ACTION OFF: 0x%x (%s) (ignored)', action,name)
+
+    def onCustomActionOn(self, pkt):
+        name,_ = rdstr(pkt, 4)
+        log.debug('T< CUSTOM ACTION ON: %s', name)
+        self.sendLR(name, '1')
+
+    def onCustomActionOff(self, pkt):
+        name,_ = rdstr(pkt, 4)
+        log.debug('T< CUSTOM ACTION OFF: %s', name)
+
+    # Transport Ring. We use jog mode only.
+    def onTransport(self, pkt):
+        jog,shutl = INT_INT.unpack_from(pkt, 4)
+        log.debug('T< TRANSPORT: jog %d, shuttle %d', jog,shutl)
+        if not jog:
+            return
+        # Every photo LR moves to gets loaded, so don't step one at a time; see JOG_SETTLE.
+        now = monotonic()
+        if not self.jogPending:
+            self.jogStarted = now
+        self.jogPending += jog
+        self.jogLast = now
+        self.schedule('jog', JOG_SETTLE, self.jogTimer)
+
+    def jogTimer(self):
+        now = monotonic()
+        wait = JOG_SETTLE - (now - self.jogLast)
+        if JOG_INTERVAL is not None:
+            wait = min(wait, JOG_INTERVAL - (now - self.jogStarted))
+        if wait > 1e-6: # not just rounding, which would have us go round again at the same time for ever
+            self.schedule('jog', wait, self.jogTimer)
+            return
+        steps = self.jogPending
+        self.jogPending = 0
+        if steps:
+            self.sendLR('StepPhoto', steps)
+            self.jogStarted = now
+
+    # Menus
+    def onMenuChange(self, pkt):
+        id,incr = INT_INT.unpack_from(pkt, 4)
+        display,verb = MENUS[id].change(incr)
+        log.debug('T< MENU CHANGE: %08x, incr %d --> %s', id,incr,display)
+        log.debug('>>> %s', verb)
+        self.sendLR(verb, '1')
+        self.sendTangent(u4(0x83)+u4(id)+encstr(display)+u4(0))
+
+    def onMenuReset(self, pkt):
+        id = rd4(pkt, 4)
+        mnu = MENUS[id]
+        mnu.index = 0
+        display, verb = mnu.get()
+        log.debug('T< MENU RESET: %08x --> %s', id,display)
+        log.debug('>>> %s', verb)
+        self.sendLR(verb, '1')
+        self.sendTangent(u4(0x83)+u4(id)+encstr(display)+u4(0))
+
+    def onMenuStringRequest(self, pkt):
+        id = rd4(pkt, 4)
+        display, _= MENUS[id].get()
+        log.debug('T< MENU STRING REQ: %08x --> %s', id,display)
+        self.sendTangent(u4(0x83)+u4(id)+encstr(display)+u4(0))
+
+    # Tangent command ID -> handler
+    TANGENT_COMMANDS = {
+        0x01: onInitiateComms,
+        0x02: onParamChange,
+        0x03: onResetParam,
+        0x04: onReadParam,
+        0x05: onMenuChange,
+        0x06: onMenuReset,
+        0x07: onMenuStringRequest,
+        0x08: onButtonDown,
+        0x09: onModeChange,
+        0x0a: onTransport,
+        0x0b: onButtonUp,
+        0x36: onCustomParamChange,
+        0x37: onCustomParamReset,
+        0x38: onReadCustomParam,
+        0x3c: onCustomActionOn,
+        0x3d: onCustomActionOff,
+    }
 
     def inboundTangent(self):
         ''' Process inbound data from Tangent '''
-        s = self.Tangent
         raw = None
         try:
-            raw = s.recv(4)
+            raw = self.Tangent.recv(RECV_SIZE)
         except socket.error as e:
-            self.log('Tangent socket closed (%s); bailing' % e)
-            self.halt = True
+            self.disconnected('Tangent', e)
+            return
+        if not raw:
+            self.disconnected('Tangent', 'closed')
             return
-        dlen = rd4(raw)
-        data = s.recv(dlen)
-        self.handleTangent(data)
+        self.tangentReceived = monotonic()
+        try:
+            frames = self.tangentFrames.feed(raw)
+        except ValueError as e:
+            # The stream is out of step and can't be resynchronised; start again with a fresh connection
+            self.disconnected('Tangent', e)
+            return
+        for frame in frames:
+            if self.capture:
+                self.capture.record(Capture.TANGENT_IN, frame, self.tangentReceived)
+            self.handleTangent(frame)
 
     # Custom logic
     def upDownStateMachine(self, key, keyUp):
@@ -360,43 +1265,83 @@ class Bridge(object):
         elif action==0x40000002:
             self.upDownStateMachine(2, up)
         else:
-            self.log('Unhandled custom button action %08x'%action)
+            log.warning('Unhandled custom button action %08x', action)
 
     def encoderCustom(self, param, incr=None, reset=False):
-        if action==0x40000003:
+        if param==0x40000003:
             # Acknowledge, but otherwise ignore
-            self.sendTangent(u4(0x82) + u4(action) + encf(0.5) + u4(0))
+            self.sendTangent(u4(0x82) + u4(param) + encf(0.5) + u4(0))
         else:
-            self.log('Unhandled custom encoder action %08x'%action)
+            log.warning('Unhandled custom encoder action %08x', param)
 
     # -----------------------------------------------------------------
     # MIDI2LR logic
 
-    def runLRSendQ(self):
-        if not self.lrSendInProgress:
-            try:
-                item = self.lrQueue.get(False)
-                self.lrSendInProgress = True
-                if PYTHON3:
-                    item = bytes(item,'utf-8')
-                self.LRSend.sendall(item)
-            except Queue.Empty:
-                pass
-
-    def sendLR(self, param, value):
+    def writeLR(self, param, value):
         msg="%s %s\n"%(param,value)
         if PYTHON3:
             msg = bytes(msg, 'utf-8')
-        self.LRSend.sendall(msg)
+        self.LRSend.write(msg)
+        if self.capture:
+            self.capture.record(Capture.LR_OUT, msg[:-1])
+
+    def sendLR(self, param, value):
+        # Anything coalesced must go first, so LR sees commands in the order they were made
+        if self.lrPending:
+            self.flushLRCoalesced()
+        if param in PHOTO_CHANGES:
+            VALUES.invalidate()
+            self.lrWritten.clear() # what LR sends next is for the new photo
+        self.writeLR(param, value)
+
+    def sendLRCoalesced(self, param, value):
+        # A fast-turning knob produces far more changes than LR can keep up with.
+        # Hold them for COALESCE_WINDOW and then send only the latest value for each param.
+        self.lrPending[param] = value
+        self.schedule('coalesce', COALESCE_WINDOW, self.flushLRCoalesced)
 
-    def sendLRQueued(self, param, value):
-        # LR can't cope with too many messages at once, so queue them
-        self.lrQueue.put("%s %s\n"%(param,value))
-        self.runLRSendQ()
+    def flushLRCoalesced(self):
+        pending = self.lrPending
+        self.lrPending = collections.OrderedDict()
+        now = monotonic()
+        for param,value in pending.items():
+            self.writeLR(param, value)
+            self.lrWritten[param] = (value, now)
+            control = Control.by_name.get(param)
+            self.latency.wrote(control.id if control else param, now)
+
+    def staleFromLR(self, param, key, value):
+        '''
+        Is a value from LR for param (VALUES key `key`) older than what we have? That's so while a
+        newer change is waiting in lrPending, or LR has yet to echo the latest one we wrote.
+        '''
+        if param in self.lrPending:
+            return True
+        written = self.lrWritten.get(param)
+        if written is None:
+            return False
+        if VALUES.same(key, value, written[0]) or monotonic() - written[1] > LR_ECHO_TIMEOUT:
+            del self.lrWritten[param]
+            return False
+        return True
+
+    def sendGetValue(self, name):
+        self.sendLR('GetValue', name)
+
+    def requestLR(self, name):
+        # LR can't cope with too many messages at once, so only a few requests are in flight at a time
+        self.lrRequests.request(name)
+        if self.lrRequests.inflight:
+            self.schedule('requests', LR_REQUEST_TIMEOUT, self.expireLRRequests)
+
+    def expireLRRequests(self):
+        self.lrRequests.expire(LR_REQUEST_TIMEOUT)
+        if self.lrRequests.inflight:
+            self.schedule('requests', LR_REQUEST_TIMEOUT, self.expireLRRequests)
 
     def handleLR(self, message):
         ''' Deal with a single Midi2LR request '''
-        #self.log('<<< %s'%message)
+        #log.debug('<<< %s', message)
         command,value = message.split(b' ',1)
         if PYTHON3:
              command = command.decode('ascii')
@@ -404,68 +1349,203 @@ class Bridge(object):
             value = None
         else:
             value=float(value)
-        if value is None and command != b'TerminateApplication':
-            self.log('Received message without value: %s'%command)
-        elif command == b'SwitchProfile':
+        if value is None and command != 'TerminateApplication':
+            log.warning('Received message without value: %s', command)
+        elif command == 'SwitchProfile':
             # WRITEME
-            self.log('<<< SWITCH PROFILE %s (ignored)'%value)
-        elif command == b'TerminateApplication':
-            self.log('<<< TERMINATE (bye!)')
+            log.debug('<<< SWITCH PROFILE %s (ignored)', value)
+        elif command == 'TerminateApplication':
+            log.info('<<< TERMINATE (bye!)')
             self.halt = True
-        elif command == b'Log':
-            self.log('<<< LOG: %s'%value)
-        elif command == b'SendKey':
-            self.log('<<< SENDKEY %s (ignored)'%value)
+        elif command == 'Log':
+            log.info('<<< LOG: %s', value)
+        elif command == 'SendKey':
+            log.debug('<<< SENDKEY %s (ignored)', value)
             # TODO: This is used to send fake keystrokes to the app
         else:
-            self.log('<<< PARAM: %s -> %s (->Tangent)'%(command,value))
-            try:
-                id = Control.id_for(command) # may fail with KeyError
-                VALUES[id] = float(value)
-                self.sendTangent(u4(0x82) + u4(id) + encf(VALUES[id]) + u4(0))
+            log.debug('<<< PARAM: %s -> %s (->Tangent)', command,value)
+            control = Control.by_name.get(command)
+            if control:
+                id = control.id
+                self.latency.echo(id, self.lrReceived)
+                if self.staleFromLR(command, id, float(value)):
+                    # We have newer; keep it, but answer the Hub if it asked
+                    if id in self.hubAsked and id in VALUES:
+                        self.displayValue(id, VALUES[id], force=True)
+                else:
+                    VALUES[id] = float(value)
+                    self.displayValue(id, VALUES[id], force=id in self.hubAsked)
+                self.hubAsked.discard(id)
                 # Caution! MIDI2LR uses values 0..1 ... midi2lr has a xlation layer, need to play nicely with that. This is a job for the XML.
-            except KeyError:
+            else:
                 # Assume it's a custom param
-                VALUES[command] = float(value)
-                self.sendTangent(u4(0xa6) + encstr(command) + encf(float(value)) + u4(0))
+                self.latency.echo(command, self.lrReceived)
+                if self.staleFromLR(command, command, float(value)):
+                    if command in self.hubAsked and command in VALUES:
+                        self.displayCustom(command, VALUES[command], force=True)
+                else:
+                    VALUES[command] = float(value)
+                    self.displayCustom(command, float(value), force=command in self.hubAsked)
+                self.hubAsked.discard(command)
+            self.lrRequests.answered(command)
 
     def inboundLR(self):
         ''' Process inbound data from MIDI2LR '''
         msg = None
         try:
-            msg = self.LRRecv.recv(4096)
+            msg = self.LRRecv.recv(RECV_SIZE)
         except socket.error as e:
-            self.log('LR inbound socket closed (%s); bailing' % e)
-            self.halt = True
+            self.disconnected('LRRecv', e)
+            return
+        if not msg:
+            self.disconnected('LRRecv', 'closed')
             return
+        self.lrReceived = monotonic()
         # commands are strings, terminated with \n
-        packets = msg.split(b'\n')
+        packets = self.lrLines.feed(msg)
+        self.lrLinesPerRecv[len(packets)] += 1
         for p in packets:
+            if self.capture:
+                self.capture.record(Capture.LR_IN, p, self.lrReceived)
             if len(p):
                 self.handleLR(p)
-        self.lrSendInProgress = False
-        self.runLRSendQ()
 
     # -----------------------------------------------------------------
 
+    def logStats(self):
+        log.info('LR lines per read: %s', ' '.join(['%d:%d'%(k,v) for k,v in sorted(self.lrLinesPerRecv.items())]))
+        log.info('LR requests: %d duplicates merged, %d expired', self.lrRequests.merged, self.lrRequests.expired)
+        log.info('Value cache: %d hits, %d misses, %d custom slots recycled', self.cacheHits, self.cacheMisses, VALUES.recycled)
+        log.info('Tangent value updates: %d forwarded, %d suppressed', self.displayForwarded, self.displaySuppressed)
+        if self.populateTimes:
+            times = sorted(self.populateTimes)
+            log.info('Mode display populate time: median %.1fms, worst %.1fms over %d changes',
+                times[len(times)//2]*1000, times[-1]*1000, len(times))
+        if self.reconnects:
+            log.info('Reconnected: %s', ', '.join(['%s %d times'%(getattr(self, k).name, v) for k,v in sorted(self.reconnects.items())]))
+        for stage,histogram in self.latency.report():
+            log.info('Latency %s: %s', stage, histogram.summary())
+
+    def checkThrottle(self):
+        ''' Applies backpressure: decides whether we can accept more input from the Tangent '''
+        pending = max(self.Tangent.pending(), self.LRSend.pending())
+        if not self.throttled and pending > WRITE_HIGH_WATER:
+            log.warning('Output backlog %d bytes; pausing Tangent input', pending)
+            self.throttled = True
+        elif self.throttled and pending < WRITE_LOW_WATER:
+            log.info('Output backlog drained; resuming Tangent input')
+            self.throttled = False
+
+    def flushOutput(self):
+        try:
+            self.Tangent.flush()
+        except socket.error as e:
+            self.disconnected('Tangent', e)
+        try:
+            self.LRSend.flush()
+        except socket.error as e:
+            self.disconnected('LRSend', e)
+
+    def inboundLRAcks(self):
+        ''' LR sends an 'ok' for each command, which we just sink '''
+        try:
+            data = self.LRSend.recv(128)
+        except socket.error as e:
+            self.disconnected('LRSend', e)
+            return
+        if not data:
+            self.disconnected('LRSend', 'closed')
+
+    def dumpOnSignal(self, filename):
+        '''
+        Has SIGUSR1 log the statistics and dump the log ring to filename, where there are signals.
+        The signal handler only makes a note: logging from inside it could deadlock on the log queue's
+        lock if the signal arrived while the main loop held it. So the main loop does the work, and
+        the signal wakes it with a byte on a socket (Python 3 would otherwise carry on in select()).
+        '''
+        if not hasattr(signal, 'SIGUSR1'):
+            return
+        self.dumpFile = filename
+        self.wakeup = socket.socketpair()
+        for sock in self.wakeup:
+            sock.setblocking(False)
+        signal.set_wakeup_fd(self.wakeup[1].fileno())
+        def onDemand(signum, frame):
+            self.dumpRequested = True
+        signal.signal(signal.SIGUSR1, onDemand)
+
+    def drainWakeup(self):
+        try:
+            while self.wakeup[0].recv(RECV_SIZE):
+                pass
+        except socket.error: # nothing more to read
+            pass
+
+    def dumpIfRequested(self):
+        if self.dumpRequested:
+            self.dumpRequested = False
+            self.logStats()
+            try:
+                dumpLog(self.dumpFile)
+            except (IOError, OSError) as e:
+                log.warning('Cannot write log dump %s (%s)', self.dumpFile, e)
+
     def run(self):
-        ''' Main loop, runs until termination command received '''
-        tangent = self.Tangent.fileno()
-        lrrx = self.LRRecv.fileno()
-        lrtx = self.LRSend.fileno()
-        self.halt = False
+        ''' Main loop, runs until termination command received (or an endpoint can't be reconnected) '''
+        connections = [ self.Tangent, self.LRSend, self.LRRecv ]
         while not self.halt:
-            socketList = [ tangent, lrtx, lrrx ]
-            rlist,_,_ = select.select( socketList, [], [] )
-            if tangent in rlist:
-                self.inboundTangent()
-            if lrrx in rlist:
-                self.inboundLR()
-            if lrtx in rlist:
-                # this is an 'ok' for each command, which we just sink
-                _ = self.LRSend.recv(128)
+            try:
+                self.dumpIfRequested()
+                self.checkThrottle()
+                readers = [ c for c in connections if c.connected() and not (c is self.Tangent and self.throttled) ]
+                writers = [ c for c in connections if c.pending() ]
+                timeout = self.nextTimeout()
+                if not readers and not writers:
+                    # Nothing is connected; wait for the next reconnect attempt (select() can't wait on nothing everywhere)
+                    time.sleep(timeout)
+                    self.runTimers()
+                    continue
+                if self.wakeup:
+                    readers.append(self.wakeup[0])
+                try:
+                    rlist,_,_ = select.select(readers, writers, [], timeout)
+                except select.error as e:
+                    if e.args[0] != errno.EINTR: # a signal, e.g. SIGUSR1 (python 2 doesn't retry)
+                        raise
+                    continue
+                if self.Tangent in rlist:
+                    self.inboundTangent()
+                if self.LRRecv in rlist:
+                    self.inboundLR()
+                if self.LRSend in rlist:
+                    self.inboundLRAcks()
+                if self.wakeup and self.wakeup[0] in rlist:
+                    self.drainWakeup()
+                self.runTimers()
+                self.flushOutput()
+            except socket.error as e:
+                log.error('Socket error (%s); bailing', e)
+                self.halt = True
+        self.logStats()
+        if self.capture:
+            log.info('Captured %d records', self.capture.records)
+            self.capture.close()
 
 if __name__ == '__main__':
-    # First argument is the path to the plugin Info.lua, which must be in the same dir as the XML files. If not given, it's assumed to be the directory this file lives in.
-    bridge = Bridge(sys.argv[0])
-    bridge.run()
+    import argparse
+    parser = argparse.ArgumentParser(description='Bridges a Tangent Hub and the TangentLR Lightroom plugin')
+    parser.add_argument('--log-level', default=logging.getLevelName(LOG_LEVEL),
+            choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help='log messages at this level and above')
+    parser.add_argument('--log-file', help='where to write the log (default: %s in the plugin dir)'%LOG_FILE)
+    parser.add_argument('--console', action='store_true', help='log to stdout as well')
+    parser.add_argument('--capture', metavar='FILE', help='record all traffic to FILE, for TangentReplay.py')
+    args = parser.parse_args()
+    pluginDir = os.path.abspath(os.path.dirname(sys.argv[0]))
+    setupLogging(getattr(logging, args.log_level), args.log_file or os.path.join(pluginDir, LOG_FILE), args.console)
+    try:
+        # The plugin Info.lua must be in the same dir as the XML files; we assume that's where this file lives.
+        bridge = Bridge(sys.argv[0], capture=args.capture)
+        bridge.dumpOnSignal(os.path.join(pluginDir, LOG_DUMP_FILE))
+        bridge.run()
+    finally:
+        logging.shutdown()
@@ -0,0 +1,325 @@
+# Should work with both Python 2.7 and 3
+
+# Writes out (or checks) the controls file and panel maps defined in TangentMappingDefinitions.py,
+# together with the control table the bridge loads at startup. Run it as
+# ./TangentMappingDefinitions.py [--panel NAME] [--force] [--check] [--jobs N]
+#
+# - Only what has changed is rebuilt and rewritten; see the manifest below.
+# - The outputs can be generated in parallel, in worker processes (--jobs).
+
+import argparse
+import binascii
+import errno
+import importlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+import traceback
+
+from TangentMapping import TABLE_FILE, merge_mode_parameters, mode_parameters, read_table, write_table
+
+# The definitions module (TangentMappingDefinitions) being generated; see main and run_tasks.
+DEFINITIONS = None
+
+def open_xml(filename, mode='r'):
+    if sys.version_info[0] < 3:
+        # N.B. assumes latin_1 encoding; ASCII + some high-bit-set characters
+        return open(filename, mode)
+    else:
+        return open(filename, mode, encoding='latin_1')
+
+def write_file(filename, obj):
+    # The XML is written out as it is generated, rather than built up in memory first
+    with open_xml(filename, 'w') as f:
+        f.writelines( obj.emit(0, DEFINITIONS.controls) )
+    print("Wrote to %s"%filename)
+
+def check_file(filename, obj):
+    '''
+    Compares the XML for obj with the existing file (e.g. as committed), without writing anything.
+    Returns True if they are identical.
+    '''
+    try:
+        with open_xml(filename) as f:
+            existing = f.read().split('\n')
+    except IOError:
+        print("%s: missing"%filename)
+        return False
+    generated = obj.xml(0, DEFINITIONS.controls).split('\n')
+    for line, (old, new) in enumerate(zip(existing, generated)):
+        if old != new:
+            print("%s:%d: differs:\n  file:      %s\n  generated: %s"%(filename, line+1, old.strip(), new.strip()))
+            return False
+    if len(existing) != len(generated):
+        print("%s: differs in length (%d lines, %d generated)"%(filename, len(existing), len(generated)))
+        return False
+    print("%s: OK"%filename)
+    return True
+
+##############################################################
+# Only rewriting what has changed.
+# The manifest records, for each output file, a hash of the source it was built from and of what was
+# written. A file is only rebuilt if its source hash has changed (or the file isn't what was written),
+# and only rewritten if its contents would change; so the Tangent Mapper only reloads what it must.
+# Hashes are CRC32s, as for the control table: they only have to spot changes.
+
+MANIFEST_FILE = 'maps-manifest.json'
+# A run only holds the manifest's lock file while it rewrites the manifest; one older than this
+# (seconds) was left behind by a run that didn't finish
+MANIFEST_LOCK_STALE = 2.0
+
+def crc(data, h=0):
+    return binascii.crc32(data, h) & 0xffffffff
+
+def factory_lines(factory, lines):
+    '''
+    Returns the range of indexes into lines (the definitions' source) taken by a @panel_map function:
+    from its decorator, past its def line, up to the next line that starts in column 0.
+    '''
+    start = factory.__code__.co_firstlineno - 1
+    end = start
+    while not lines[end].startswith(b'def '):
+        end += 1
+    end += 1
+    while end < len(lines) and (not lines[end].strip() or lines[end][:1] in (b' ', b'\t')):
+        end += 1
+    return range(start, end)
+
+def source_hashes():
+    '''
+    Returns a dict: output name ('controls' or a panel in MAPS) -> hash of the source it is built from.
+    A panel's map depends on its own factory function and on everything else in the definitions and
+    in TangentMapping.py, but not on the other panels' factories. controls.xml (with the control table,
+    which lists every map's parameters) depends on all of it.
+    '''
+    directory = os.path.dirname(os.path.abspath(DEFINITIONS.__file__))
+    with open(os.path.join(directory, 'TangentMapping.py'), 'rb') as f:
+        common = crc(f.read())
+    with open(os.path.join(directory, 'TangentMappingDefinitions.py'), 'rb') as f:
+        lines = f.read().split(b'\n')
+    maps = DEFINITIONS.MAPS
+    shared = list(lines)
+    own = {}
+    for name in maps:
+        span = factory_lines(maps[name][1], lines)
+        own[name] = b'\n'.join(lines[span[0]:span[-1]+1])
+        for i in span:
+            shared[i] = None
+    common = crc(b'\n'.join([ l for l in shared if l is not None ]), common)
+    rv = dict([ (name, '%08x' % crc(own[name], common)) for name in maps ])
+    rv['controls'] = '%08x' % crc(b'\n'.join(lines), common)
+    return rv
+
+def text_hash(fragments):
+    ''' Hashes text given as a series of strings, as it would be written out '''
+    h = 0
+    for s in fragments:
+        h = crc(s.encode('latin_1') if sys.version_info[0] >= 3 else s, h)
+    return '%08x' % h
+
+def file_hash(filename):
+    ''' Hashes an existing output file (see text_hash), or returns None if it can't be read '''
+    try:
+        with open_xml(filename) as f:
+            return text_hash(iter(lambda: f.read(65536), ''))
+    except IOError:
+        return None
+
+def read_manifest():
+    try:
+        with open(MANIFEST_FILE) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+def update_manifest(entries):
+    '''
+    Merges entries (filename -> dict) into the manifest file, replacing it in one go.
+    Several runs may do this at once (make -j), so they take turns, holding a lock file.
+    '''
+    lock = MANIFEST_FILE + '.lock'
+    locked = False
+    for i in range(100):
+        try:
+            os.close(os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            locked = True
+            break
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+        try:
+            if time.time() - os.path.getmtime(lock) > MANIFEST_LOCK_STALE:
+                # Left behind by a run that was killed
+                print("Removing stale lock %s"%lock)
+                os.remove(lock)
+                continue
+        except OSError: # the run holding it has just finished
+            continue
+        time.sleep(0.05)
+    if not locked:
+        print("Could not lock %s; updating it regardless"%MANIFEST_FILE)
+    try:
+        manifest = read_manifest() # again, in case another run has changed it meanwhile
+        manifest.update(entries)
+        fd, tmp = tempfile.mkstemp(prefix=MANIFEST_FILE + '.', suffix='.tmp', dir=os.path.dirname(os.path.abspath(MANIFEST_FILE)))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+            f.write('\n')
+        if hasattr(os, 'replace'):
+            os.replace(tmp, MANIFEST_FILE)
+        else:
+            try:
+                os.rename(tmp, MANIFEST_FILE)
+            except OSError: # Windows won't rename over an existing file
+                os.remove(MANIFEST_FILE)
+                os.rename(tmp, MANIFEST_FILE)
+    finally:
+        if locked:
+            os.remove(lock)
+
+def update_file(filename, build, source, manifest, force=False):
+    '''
+    Brings one output file up to date with its definitions. Returns its new manifest entry.
+    build is a function returning the object to write, only called if it's needed;
+    source is the hash of the definitions it is built from (see source_hashes).
+    '''
+    entry = manifest.get(filename, {})
+    existing = file_hash(filename)
+    if not force and entry.get('source') == source and existing is not None and entry.get('output') == existing:
+        print("%s is up to date"%filename)
+        return entry
+    obj = build()
+    generated = text_hash(obj.emit(0, DEFINITIONS.controls))
+    if generated == existing:
+        print("%s is unchanged"%filename)
+    else:
+        write_file(filename, obj)
+    return { 'source': source, 'output': generated }
+
+
+##############################################################
+# Generating outputs in parallel (see --jobs).
+# Each output is generated (and its map built and checked) by generate, which can run in a worker
+# process. What it prints and any error are handed back, and reported in the same order as if the
+# outputs had been generated one after another.
+
+def output_file(name):
+    ''' The file written for an output name: 'controls' or a panel in MAPS '''
+    return 'controls.xml' if name == 'controls' else DEFINITIONS.MAPS[name][0]
+
+class Output(object):
+    ''' Collects what is printed while generating an output '''
+    def __init__(self):
+        self.parts = []
+    def write(self, s):
+        self.parts.append(s)
+    def flush(self):
+        pass
+
+def generate(task):
+    '''
+    Does the work for one output. task is a dict:
+        name: 'controls' or a panel in MAPS
+        action: 'update' (see update_file, which also takes source, manifest and force from task),
+                'check' (see check_file) or None
+        params: if True, also work out the map's mode_parameters (for the control table)
+    Returns a dict: name; printed (what it printed); error (a traceback, or None);
+    and entry (the new manifest entry), ok (whether the check passed) or params, as asked for.
+    '''
+    defs = DEFINITIONS
+    name = task['name']
+    rv = { 'name': name, 'error': None }
+    out = Output()
+    saved, sys.stdout = sys.stdout, out
+    try:
+        filename = output_file(name)
+        build = (lambda: defs.controls) if name == 'controls' else (lambda: defs.get_map(name))
+        if task['action'] == 'update':
+            rv['entry'] = update_file(filename, build, task['source'], task['manifest'], task['force'])
+        elif task['action'] == 'check':
+            rv['ok'] = check_file(filename, build())
+        if task['params']:
+            rv['params'] = mode_parameters(defs.controls, [ defs.get_map(name) ])
+    except Exception:
+        rv['error'] = traceback.format_exc()
+    finally:
+        sys.stdout = saved
+    rv['printed'] = ''.join(out.parts)
+    return rv
+
+def use_definitions(module):
+    '''
+    Sets the definitions to generate, by module name. Worker processes are started with this:
+    a module can't be handed to them, but '__main__' is the definitions in them too, whether
+    they were forked or (where there is no fork) started afresh and the definitions imported again.
+    '''
+    global DEFINITIONS
+    DEFINITIONS = importlib.import_module(module)
+
+def run_tasks(tasks, jobs=1):
+    '''
+    Runs generate on each task, using up to jobs worker processes (0 means one per CPU).
+    Returns the results in the same order as tasks.
+    '''
+    if jobs == 1 or len(tasks) < 2:
+        return [ generate(t) for t in tasks ]
+    pool = multiprocessing.Pool(min(jobs or multiprocessing.cpu_count(), len(tasks)),
+                                use_definitions, (DEFINITIONS.__name__,))
+    try:
+        return pool.map(generate, tasks, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+def main(definitions):
+    ''' The command line; definitions is the TangentMappingDefinitions module '''
+    global DEFINITIONS
+    DEFINITIONS = definitions
+    maps = definitions.MAPS
+    parser = argparse.ArgumentParser(description='Generates the Tangent controls file and panel maps')
+    parser.add_argument('--panel', action='append', choices=['controls'] + list(maps),
+            help='only generate this (may be repeated); "controls" is controls.xml and %s. Default: everything' % TABLE_FILE)
+    parser.add_argument('--force', action='store_true',
+            help='rebuild everything asked for, even if its definitions have not changed (unchanged files are still left alone)')
+    parser.add_argument('--check', action='store_true',
+            help='check the existing XML files match the definitions, instead of writing them; exits 1 if not')
+    parser.add_argument('--jobs', '-j', type=int, default=1, metavar='N',
+            help='generate up to N outputs at once, each in its own process (0: one per CPU; default 1)')
+    args = parser.parse_args()
+    outputs = ['controls'] + list(maps)
+    wanted = args.panel or outputs
+
+    if args.check:
+        tasks = [ { 'name': name, 'action': 'check', 'params': False } for name in outputs if name in wanted ]
+    else:
+        manifest = read_manifest()
+        sources = source_hashes()
+        # the table lists which parameters each mode shows, so it needs every map
+        needTable = 'controls' in wanted and (args.force or read_table(TABLE_FILE) is None)
+        tasks = []
+        for name in outputs:
+            filename = output_file(name)
+            task = { 'name': name, 'action': 'update' if name in wanted else None,
+                     'params': needTable and name != 'controls',
+                     'source': sources[name], 'manifest': { filename: manifest.get(filename, {}) }, 'force': args.force }
+            if task['action'] or task['params']:
+                tasks.append(task)
+
+    results = run_tasks(tasks, args.jobs)
+    failed = []
+    for r in results:
+        sys.stdout.write(r['printed'])
+        if r['error'] or not r.get('ok', True):
+            failed.append(r)
+    for r in failed:
+        if r['error']:
+            print("Error generating %s:\n%s" % (r['name'], r['error']))
+    if not args.check:
+        update_manifest(dict([ (output_file(r['name']), r['entry']) for r in results if 'entry' in r ]))
+        if needTable and not failed:
+            write_table(TABLE_FILE, definitions.controls, merge_mode_parameters([ r['params'] for r in results if 'params' in r ]))
+            print("Wrote to %s"%TABLE_FILE)
+    sys.exit(1 if failed else 0)
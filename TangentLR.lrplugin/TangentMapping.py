@@ -2,6 +2,11 @@
 # Should work with both Python 2.7 and 3
 
 import abc
+import binascii
+import collections
+import marshal
+import os
+import sys
 
 # This module declares:
 #   Objects to make it easier to specify control mappings
@@ -19,13 +24,19 @@ class XMLable(object):
     def __init__(self):
         self.TYPES = {}
 
-    @abc.abstractmethod
     def xml(self, indent=0, controlsfile=None):
         """
         Returns an XML representation of this object, starting at the given indent level.
         Indent levels are expressed as number of tabs (see TABSIZE).
         The result is a multi-line string.
         """
+        return ''.join(self.emit(indent, controlsfile))
+    @abc.abstractmethod
+    def emit(self, indent=0, controlsfile=None):
+        """
+        Generates the XML representation of this object (see xml) as a series of strings,
+        so that it can be written out as it is produced.
+        """
         pass
     def element(self, name, tabs=0):
         """
@@ -65,6 +76,21 @@ class XMLable(object):
         '''
         pass
 
+def indent_lines(fragments, baseindent):
+    ''' Prefixes each line of the text made up of fragments with baseindent, as the fragments go by '''
+    linestart = True
+    for s in fragments:
+        if not s:
+            continue
+        out = s.replace('\n', '\n' + baseindent)
+        if linestart:
+            out = baseindent + out
+        linestart = s.endswith('\n')
+        if linestart:
+            # the next line is indented when (and if) it arrives
+            out = out[:len(out)-len(baseindent)]
+        yield out
+
 ##################################################################33
 # CONTROLS FILES
 
@@ -85,14 +111,13 @@ class Action(XMLable):
             self.Name20 = self.Name20[0:20]
         self.MinValue = None
         self.MaxValue = None
-    def xml(self, indent, cf):
+    def emit(self, indent, cf):
         self.check(cf)
         baseindent = TAB * indent
-        rv  = baseindent + '<Action id="0x%08x">\n' % self.id
-        rv += self.element('Name', indent+1)
-        rv += self.optionals(['Name9', 'Name14', 'Name20'], indent+1)
-        rv += baseindent + '</Action>\n'
-        return rv
+        yield baseindent + '<Action id="0x%08x">\n' % self.id
+        yield self.element('Name', indent+1)
+        yield self.optionals(['Name9', 'Name14', 'Name20'], indent+1)
+        yield baseindent + '</Action>\n'
     def check(self, controlsfile):
         assert self.id is not None
         assert self.Name is not None
@@ -117,14 +142,13 @@ class Parameter(XMLable):
         self.MinValue=minval
         self.MaxValue=maxval
         self.StepSize=stepsize
-    def xml(self, indent, cf):
+    def emit(self, indent, cf):
         self.check(cf)
         baseindent = TAB * indent
-        rv  = baseindent + '<Parameter id="0x%08x">\n' % self.id
-        rv += self.elements(['Name', 'MinValue', 'MaxValue', 'StepSize'], indent+1)
-        rv += self.optionals(['Name9', 'Name10', 'Name12'], indent+1)
-        rv += baseindent + '</Parameter>\n'
-        return rv
+        yield baseindent + '<Parameter id="0x%08x">\n' % self.id
+        yield self.elements(['Name', 'MinValue', 'MaxValue', 'StepSize'], indent+1)
+        yield self.optionals(['Name9', 'Name10', 'Name12'], indent+1)
+        yield baseindent + '</Parameter>\n'
     def check(self, controlsfile):
         assert self.id is not None
         assert self.Name is not None
@@ -135,9 +159,10 @@ class Parameter(XMLable):
 ALL_MENUS = {} # indexed by id
 
 class Menu(XMLable):
-    def __init__(self,id, name, verbs, panel=None, name9=None, name14=None, name20=None):
+    def __init__(self,id, name, verbs, panel=None, name9=None, name14=None, name20=None, register=True):
         # verbs is a dict, mapping DISPLAYNAME to MIDI2LR-VERB
         # e.g. {'Colour':'SetTreatmentColor', 'B&W':'SetTreatmentBW'}
+        # register=False keeps it out of ALL_MENUS (see read_table)
         super(Menu, self).__init__()
         self.id = id
         self.Name = name
@@ -153,9 +178,10 @@ class Menu(XMLable):
             self.Name20 = self.Name20[0:20]
         self.MinValue = None
         self.MaxValue = None
-        assert id not in ALL_MENUS
         self.index = 0 # currently selected index; TODO can we read these out of LR?
-        ALL_MENUS[id] = self
+        if register:
+            assert id not in ALL_MENUS
+            ALL_MENUS[id] = self
     def get(self):
         # returns a tuple (Display string, MIDI2LR verb)
         key = list(self.verbs.keys())[self.index]
@@ -168,14 +194,13 @@ class Menu(XMLable):
             t = 0
         self.index = t
         return self.get()
-    def xml(self, indent, cf):
+    def emit(self, indent, cf):
         self.check(cf)
         baseindent = TAB * indent
-        rv  = baseindent + '<Menu id="0x%08x">\n' % self.id
-        rv += self.element('Name', indent+1)
-        rv += self.optionals(['Name9', 'Name14', 'Name20'], indent+1)
-        rv += baseindent + '</Menu>\n'
-        return rv
+        yield baseindent + '<Menu id="0x%08x">\n' % self.id
+        yield self.element('Name', indent+1)
+        yield self.optionals(['Name9', 'Name14', 'Name20'], indent+1)
+        yield baseindent + '</Menu>\n'
     def check(self, controlsfile):
         assert self.id is not None
         assert self.Name is not None
@@ -188,14 +213,14 @@ class Group(XMLable):
         super(Group, self).__init__()
         self.name = name
         self.controls = controls
-    def xml(self, indent, cf):
+    def emit(self, indent, cf):
         self.check(cf)
         baseindent = TAB * indent
-        rv  = baseindent + '<Group name="%s">\n' % self.name
+        yield baseindent + '<Group name="%s">\n' % self.name
         for a in self.controls:
-            rv += a.xml(indent+1, cf)
-        rv += baseindent + '</Group>\n'
-        return rv
+            for s in a.emit(indent+1, cf):
+                yield s
+        yield baseindent + '</Group>\n'
     def check(self, controlsfile):
         assert self.name is not None
         assert self.controls is not None
@@ -266,20 +291,20 @@ class Mode(XMLable):
                 print(('Creating control bank %s in mode %08x'%(mcb.id,self.id)))
                 self.controlbanks.append(mcb)
 
-    def xml(self, indent, cf):
+    def emit(self, indent, cf):
         self.check(cf)
         baseindent = TAB * indent
         namecomment = ''
         if not self.Name:
             namecomment = ' <!-- %s -->' % cf.find_mode(self.id).Name
-        rv  = baseindent + '<Mode id="0x%08x">%s\n' % (self.id,namecomment)
+        yield baseindent + '<Mode id="0x%08x">%s\n' % (self.id,namecomment)
         if self.Name:
-            rv += self.element('Name', indent+1)
+            yield self.element('Name', indent+1)
         if self.controlbanks:
             for cb in self.controlbanks:
-                rv += cb.xml(indent+1, cf)
-        rv += baseindent + '</Mode>\n'
-        return rv
+                for s in cb.emit(indent+1, cf):
+                    yield s
+        yield baseindent + '</Mode>\n'
     def check(self, controlsfile):
         assert self.id is not None
         assert (self.Name and not self.controlbanks) or (type(self.controlbanks) is list and not self.Name)
@@ -303,58 +328,74 @@ class ControlsFile(XMLable):
         super(ControlsFile, self).__init__()
         self.modes = modes
         self.groups = groups
-    def xml(self, indent, cf):
+        self.reindex()
+    def reindex(self):
+        '''
+        (Re)builds the lookups by ID used by the find_ methods. Call this after changing modes or groups.
+        Raises an exception if two modes, or two controls (including RESERVED_CONTROLS), share an ID.
+        '''
+        self.mode_by_id = {}
+        self.mode_index = {}
+        for idx,m in enumerate(self.modes):
+            if m.id in self.mode_by_id:
+                raise Exception('Duplicate mode ID 0x%08x (%s, %s)'%(m.id, self.mode_by_id[m.id].Name, m.Name))
+            self.mode_by_id[m.id] = m
+            self.mode_index[m.id] = idx
+        self.control_by_id = {}
+        for c in [ c for g in self.groups for c in g.controls ] + RESERVED_CONTROLS:
+            if c.id in self.control_by_id:
+                raise Exception('Duplicate control ID 0x%08x (%s, %s)'%(c.id, self.control_by_id[c.id], c))
+            self.control_by_id[c.id] = c
+    def emit(self, indent, cf):
         self.check(cf)
-        rv = FILEHEADER%'ControlSystem' + '''<Capabilities>
+        baseindent = TAB * indent
+        if indent:
+            # every line of the document is indented, including the header
+            for s in indent_lines(self.emit(0, cf), baseindent):
+                yield s
+            return
+        yield FILEHEADER%'ControlSystem' + '''<Capabilities>
     <Jog enabled="true"/>
     <Shuttle enabled="false"/>
     <StatusDisplay lineCount="3"/>
     <CustomControls enabled="true"/>
   </Capabilities>
 '''
-        rv += TAB + '<Modes>\n'
+        yield TAB + '<Modes>\n'
         for m in self.modes:
-            rv += m.xml(2,cf)
-        rv += TAB + '</Modes>\n'
-        rv += TAB + '<Controls>\n'
+            for s in m.emit(2,cf):
+                yield s
+        yield TAB + '</Modes>\n'
+        yield TAB + '<Controls>\n'
         for g in self.groups:
-            rv += g.xml(2,cf)
-        rv += TAB + '</Controls>\n'
-        rv += '''  <DefaultGlobalSettings>
+            for s in g.emit(2,cf):
+                yield s
+        yield TAB + '</Controls>\n'
+        yield '''  <DefaultGlobalSettings>
     <KnobSensitivity std="1" alt="5"/>
     <JogDialSensitivity std="1" alt="5"/>
     <TrackerballSensitivity std="1" alt="5"/>
     <TrackerballDialSensitivity std="1" alt="5"/>
     <IndependentPanelBanks enabled="false"/>
   </DefaultGlobalSettings>
-''' + FILEFOOTER
-        lines = rv.split('\n')
-        baseindent = TAB * indent
-        return ''.join([ baseindent + l + '\n' for l in lines ])
+''' + FILEFOOTER + '\n'
     def check(self, controlsfile=None):
         for m in self.modes:
             m.check(controlsfile)
         for g in self.groups:
             g.check(controlsfile)
     def find_mode(self, id):
-        for m in self.modes:
-            if m.id == id:
-                return m
-        raise Exception('Mode 0x%08x not found'%id)
+        if id not in self.mode_by_id:
+            raise Exception('Mode 0x%08x not found'%id)
+        return self.mode_by_id[id]
     def find_mode_index(self, id):
-        for idx in range(len(self.modes)):
-            if self.modes[idx].id == id:
-                return idx
-        raise Exception('Mode 0x%08x not found'%id)
+        if id not in self.mode_index:
+            raise Exception('Mode 0x%08x not found'%id)
+        return self.mode_index[id]
     def find_control(self, id):
-        for g in self.groups:
-            for c in g.controls:
-                if c.id == id:
-                    return c
-        for c in RESERVED_CONTROLS:
-            if c.id == id:
-                return c
-        raise Exception('Control 0x%08x not found'%id)
+        if id not in self.control_by_id:
+            raise Exception('Control 0x%08x not found'%id)
+        return self.control_by_id[id]
 
 
 ##################################################################33
@@ -367,17 +408,19 @@ class Mapping(XMLable):
         self.key = key
         self.arg = arg
         self.customName = customName
-    def xml(self, indent, cf):
+    def emit(self, indent, cf):
         self.check(cf)
         bind = TAB * indent
-        rv = bind + '<Mapping mode="%s">\n' % self.mode
-        rv += bind + TAB + '<Key>0x%08x</Key> <!-- %s -->\n' % (self.key, cf.find_control(self.key))
+        rv = [ bind + '<Mapping mode="%s">\n' % self.mode ]
+        rv.append(bind + TAB + '<Key>0x%08x</Key> <!-- %s -->\n' % (self.key, cf.find_control(self.key)))
         if self.arg:
-            rv += bind + TAB + '<Argument>0x%08x</Argument>\n' % self.arg
+            rv.append(bind + TAB + '<Argument>0x%08x</Argument>\n' % self.arg)
         if self.customName:
-            rv += bind + TAB + '<CustomName>%s</CustomName>\n' % self.customName
-        rv += bind + '</Mapping>\n'
-        return rv
+            rv.append(bind + TAB + '<CustomName>%s</CustomName>\n' % self.customName)
+        rv.append(bind + '</Mapping>\n')
+        # Controls (and so Mappings) are the bulk of a map file: yielding each as one
+        # fragment saves passing many small ones up through every enclosing emit
+        yield ''.join(rv)
     def check(self, controlsfile):
         assert self.mode in ['Std','Alt']
         assert self.key is not None
@@ -404,16 +447,16 @@ class Control(XMLable):
         self.alt = alt
         if isinstance(alt, int):
             self.alt = Alt(alt)
-    def xml(self, indent, cf):
+    def emit(self, indent, cf):
         self.check(cf)
         baseindent = TAB * indent
-        rv = baseindent + '<Control type="%s" number="%d">\n' % (self.type, self.number)
+        rv = [ baseindent + '<Control type="%s" number="%d">\n' % (self.type, self.number) ]
         if self.std:
-            rv += self.std.xml(indent+1, cf)
+            rv.extend(self.std.emit(indent+1, cf))
         if self.alt:
-            rv += self.alt.xml(indent+1, cf)
-        rv += baseindent + '</Control>\n'
-        return rv
+            rv.extend(self.alt.emit(indent+1, cf))
+        rv.append(baseindent + '</Control>\n')
+        yield ''.join(rv) # see Mapping.emit
     def check(self, controlsfile):
         assert self.type is not None
         assert self.number is not None
@@ -430,13 +473,13 @@ class Bank(XMLable):
     # A bank of one or more controls
     def __init__(self, controls):
         self.controls = controls
-    def xml(self, indent, cf):
+    def emit(self, indent, cf):
         self.check(cf)
-        rv = TAB*indent + '<Bank>\n'
+        yield TAB*indent + '<Bank>\n'
         for c in self.controls:
-            rv += c.xml(indent+1,cf)
-        rv += TAB*indent + '</Bank>\n'
-        return rv
+            for s in c.emit(indent+1,cf):
+                yield s
+        yield TAB*indent + '</Bank>\n'
     def check(self, controlsfile):
         for c in self.controls:
             c.check(controlsfile)
@@ -446,13 +489,13 @@ class ControlBank(XMLable):
     def __init__(self, id, banks):
         self.id = id
         self.banks = banks
-    def xml(self, indent, cf):
+    def emit(self, indent, cf):
         self.check(cf)
-        rv = TAB*indent + '<ControlBank id="%s">\n'%self.id
+        yield TAB*indent + '<ControlBank id="%s">\n'%self.id
         for b in self.banks:
-            rv += b.xml(indent+1,cf)
-        rv += TAB*indent + '</ControlBank>\n'
-        return rv
+            for s in b.emit(indent+1,cf):
+                yield s
+        yield TAB*indent + '</ControlBank>\n'
     def check(self, controlsfile):
         assert self.id is not None
         for b in self.banks:
@@ -466,13 +509,13 @@ class Panel(XMLable):
         self.ignoreModesCheck = ignoreModesCheck
         for m in self.modes:
             m.merge(self.sharedControlBanks)
-    def xml(self, indent, cf):
+    def emit(self, indent, cf):
         self.check(cf)
-        rv = TAB*indent + '<Panel type="%s">\n' % self.panelType
+        yield TAB*indent + '<Panel type="%s">\n' % self.panelType
         for m in self.modes:
-            rv += m.xml(indent+1, cf)
-        rv += TAB*indent + '</Panel>'
-        return rv
+            for s in m.emit(indent+1, cf):
+                yield s
+        yield TAB*indent + '</Panel>'
     def check(self, controlsfile):
         assert controlsfile is not None
         assert self.panelType is not None
@@ -492,18 +535,130 @@ class Panel(XMLable):
 class MapFile(XMLable):
     def __init__(self, panels):
         self.panels = panels
-    def xml(self, indent, cf):
+    def emit(self, indent, cf):
         self.check(cf)
-        rv = FILEHEADER%'PanelMap'
-        rv += TAB*(indent+1) + '<Panels>\n'
+        yield FILEHEADER%'PanelMap'
+        yield TAB*(indent+1) + '<Panels>\n'
         for p in self.panels:
-            rv += p.xml(indent+2, cf) + '\n'
-        rv += TAB*(indent+1) + '</Panels>\n'
-        rv += FILEFOOTER
-        return rv
+            for s in p.emit(indent+2, cf):
+                yield s
+            yield '\n'
+        yield TAB*(indent+1) + '</Panels>\n'
+        yield FILEFOOTER
     def check(self, controlsfile):
         assert self.panels
 
+##################################################################33
+# CONTROL TABLE
+#
+# The bridge only needs the controls file (IDs, names, ranges, menu verbs, modes) and which
+# parameters each mode shows, not the panel maps themselves. Building all of those from
+# TangentMappingDefinitions takes a while, so the generator also writes them out as a compact
+# marshalled table. The table records a hash of the sources it came from, and read_table
+# refuses it if they have changed since.
+
+TABLE_FILE = 'controls.table'
+TABLE_VERSION = 1
+TABLE_SOURCES = ['TangentMapping.py', 'TangentMappingDefinitions.py']
+
+def source_hash(directory=None):
+    '''
+    Hashes the mapping sources (and the table format and Python major version, as marshal
+    formats differ between them). Returns None if the sources can't be read.
+    CRC32 is plenty to spot an edit, and unlike hashlib costs nothing to import.
+    '''
+    directory = directory or os.path.dirname(os.path.abspath(__file__))
+    h = binascii.crc32(('%d %d\n' % (TABLE_VERSION, sys.version_info[0])).encode('ascii'))
+    try:
+        for name in TABLE_SOURCES:
+            with open(os.path.join(directory, name), 'rb') as f:
+                h = binascii.crc32(f.read(), h)
+    except (IOError, OSError):
+        return None
+    return h & 0xffffffff
+
+def mode_parameters(controlsfile, mapfiles):
+    '''
+    Works out which parameters each mode shows on the encoders, from the panel maps.
+    Returns a dict: mode ID -> list of parameter control IDs.
+    '''
+    parameters = set([ c.id for g in controlsfile.groups for c in g.controls if isinstance(c, Parameter) ])
+    rv = {}
+    for mf in mapfiles:
+        for panel in mf.panels:
+            for mode in panel.modes:
+                params = rv.setdefault(mode.id, [])
+                for cb in mode.controlbanks:
+                    for bank in cb.banks:
+                        for ctrl in bank.controls:
+                            if ctrl.type != 'Encoder':
+                                continue
+                            for mapping in (ctrl.std, ctrl.alt):
+                                if mapping and mapping.key in parameters and mapping.key not in params:
+                                    params.append(mapping.key)
+    return rv
+
+def merge_mode_parameters(results):
+    ''' Combines mode_parameters results for several map files, in order, as if worked out together '''
+    rv = {}
+    for result in results:
+        for mode in result:
+            params = rv.setdefault(mode, [])
+            for p in result[mode]:
+                if p not in params:
+                    params.append(p)
+    return rv
+
+def write_table(filename, controlsfile, modeParameters):
+    ''' Writes the parts of controlsfile the bridge needs, and modeParameters (see mode_parameters) '''
+    groups = []
+    for g in controlsfile.groups:
+        ctrls = []
+        for c in g.controls:
+            if isinstance(c, Parameter):
+                ctrls.append(('Parameter', c.id, c.Name, c.MinValue, c.MaxValue, c.StepSize))
+            elif isinstance(c, Menu):
+                # menus are cycled through in order, so keep it
+                ctrls.append(('Menu', c.id, c.Name, [ (k, c.verbs[k]) for k in c.verbs ]))
+            else:
+                ctrls.append(('Action', c.id, c.Name))
+        groups.append((g.name, ctrls))
+    table = {
+        'hash': source_hash(),
+        'modes': [ (m.id, m.Name) for m in controlsfile.modes ],
+        'groups': groups,
+        'mode_parameters': modeParameters,
+    }
+    with open(filename, 'wb') as f:
+        marshal.dump(table, f, 2)
+
+def read_table(filename):
+    '''
+    Reads a table written by write_table.
+    Returns (ControlsFile, mode_parameters), or None if the table is missing, unreadable or stale.
+    Menus read from the table are not registered in ALL_MENUS.
+    '''
+    try:
+        with open(filename, 'rb') as f:
+            table = marshal.load(f)
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        return None
+    if not isinstance(table, dict) or table.get('hash') is None or table.get('hash') != source_hash(os.path.dirname(os.path.abspath(filename))):
+        return None
+    groups = []
+    for name, ctrls in table['groups']:
+        controls = []
+        for c in ctrls:
+            if c[0] == 'Parameter':
+                controls.append(Parameter(c[1], c[2], minval=c[3], maxval=c[4], stepsize=c[5]))
+            elif c[0] == 'Menu':
+                controls.append(Menu(c[1], c[2], collections.OrderedDict(c[3]), register=False))
+            else:
+                controls.append(Action(c[1], c[2]))
+        groups.append(Group(name, controls))
+    modes = [ Mode(id, name) for id,name in table['modes'] ]
+    return ControlsFile(modes, groups), table['mode_parameters']
+
 if __name__ == '__main__':
     # This is test code.. for the real outputs, see TangentMappingDefinitions
     t1 = Action(42, 'myACtion', name14='itsname14')
@@ -514,7 +669,7 @@ if __name__ == '__main__':
     #print(mnu.xml(1, None))
     g = Group('mygroup', [t1,t2,Action(0x100, 'foo'),Action(0x101, 'bar'),Action(0x200,'baz'),Action(0x201,'qux'),Action(0xfff,'qix'), mnu])
     #print(g.xml(0))
-    cf = ControlsFile([Mode(1,'Develop'), Mode(2,'Navigate')], [g, g])
+    cf = ControlsFile([Mode(1,'Develop'), Mode(2,'Navigate')], [g])
     cf.check(None)
     #print(cf.xml(0,cf))
     c = Button(10, Std(0x100, arg=0x42), Alt(0x0101, arg=0x43, customName='foobar'))
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# Should work with both Python 2.7 and 3
+
+# Replays a session recorded with `TangentBridge.py --capture FILE` through a Bridge,
+# with no Tangent Hub or Lightroom attached. The recorded input from both sides is fed in
+# at the times it arrived; what the bridge sends is counted against what it sent at the time.
+#
+#   ./TangentReplay.py FILE           replay at the original speed
+#   ./TangentReplay.py --fast FILE    replay as fast as possible
+#
+# With --fast the bridge runs on a virtual clock which jumps to the time of each recorded
+# input, so its timers (coalescing, display rate limit, jog, request expiry) behave as they
+# did in the session while the replay itself takes only as long as the bridge's own work.
+
+import argparse
+import collections
+import logging
+import sys
+import time
+
+import TangentBridge
+from TangentBridge import Bridge, Capture, Connection, readCapture, u4
+
+class ReplaySocket(object):
+    ''' Stands in for a connected socket: recv returns what was queued, send swallows everything '''
+    def __init__(self):
+        self.inq = collections.deque()
+        self.sent = 0
+
+    def setblocking(self, flag):
+        pass
+
+    def send(self, data):
+        self.sent += len(data)
+        return len(data)
+
+    def recv(self, size):
+        if not self.inq:
+            return b''
+        return self.inq.popleft()
+
+    def fileno(self):
+        return -1
+
+    def close(self):
+        pass
+
+class ReplayBridge(Bridge):
+    ''' A Bridge that talks to ReplaySockets '''
+    def connectAll(self):
+        self.Tangent = Connection('Tangent', ReplaySocket())
+        self.LRSend = Connection('LR send', ReplaySocket())
+        self.LRRecv = Connection('LR receive', ReplaySocket())
+
+class ReplayClock(object):
+    ''' Virtual time for fast replay: stands still while the bridge works, and is moved on by the replay '''
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class Session(object):
+    '''
+    The inbound traffic of a capture, as it arrived: a list of (seconds, kind, data) where data is
+    everything of that kind that arrived at that moment, framed as it was on the wire.
+    Also totals up the recorded traffic for comparison.
+    '''
+    def __init__(self, filename):
+        self.inputs = []
+        self.counts = collections.Counter() # kind -> records
+        self.bytes = collections.Counter() # kind -> bytes on the wire
+        self.length = 0
+        for kind, when, data in readCapture(filename):
+            wire = u4(len(data)) + data if kind in (Capture.TANGENT_IN, Capture.TANGENT_OUT) else data + b'\n'
+            self.counts[kind] += 1
+            self.bytes[kind] += len(wire)
+            self.length = when
+            if kind not in (Capture.TANGENT_IN, Capture.LR_IN):
+                continue
+            if self.inputs and self.inputs[-1][0] == when and self.inputs[-1][1] == kind:
+                self.inputs[-1][2] += wire
+            else:
+                self.inputs.append([when, kind, bytearray(wire)])
+
+def advance(bridge, due, clock):
+    '''
+    Runs the bridge's timers that fall due up to `due` (seconds, on the bridge's clock), then waits
+    until then. If due is None, runs timers until there are none left.
+    '''
+    while bridge.timers:
+        deadline = min([t[0] for t in bridge.timers.values()])
+        if due is not None and deadline > due:
+            break
+        if clock:
+            clock.now = max(clock.now, deadline)
+        else:
+            time.sleep(max(0, deadline - TangentBridge.monotonic()))
+        bridge.runTimers()
+        bridge.flushOutput()
+    if due is None:
+        return
+    if clock:
+        clock.now = max(clock.now, due)
+    else:
+        time.sleep(max(0, due - TangentBridge.monotonic()))
+
+def replay(session, fast=False):
+    ''' Feeds a Session through a fresh ReplayBridge. Returns (bridge, wall clock seconds taken). '''
+    realtime = TangentBridge.monotonic
+    clock = None
+    if fast:
+        clock = ReplayClock()
+        TangentBridge.monotonic = clock
+    try:
+        bridge = ReplayBridge(sys.argv[0])
+        bridge.halt = False
+        start = realtime()
+        base = TangentBridge.monotonic()
+        for when, kind, data in session.inputs:
+            advance(bridge, base + when, clock)
+            if kind == Capture.TANGENT_IN:
+                bridge.Tangent.sock.inq.append(bytes(data))
+                bridge.inboundTangent()
+            else:
+                bridge.LRRecv.sock.inq.append(bytes(data))
+                bridge.inboundLR()
+            bridge.runTimers()
+            bridge.flushOutput()
+            if bridge.halt:
+                break
+        advance(bridge, None, clock)
+        return bridge, realtime() - start
+    finally:
+        TangentBridge.monotonic = realtime
+
+def main():
+    parser = argparse.ArgumentParser(description='Replays a session captured by TangentBridge.py --capture')
+    parser.add_argument('capture', help='capture file')
+    parser.add_argument('--fast', action='store_true', help='replay as fast as possible, not at the original speed')
+    parser.add_argument('--log-level', default='WARNING', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+            help="show the bridge's log at this level (INFO includes its statistics)")
+    args = parser.parse_args()
+    TangentBridge.setupLogging(getattr(logging, args.log_level), console=True)
+
+    session = Session(args.capture)
+    bridge, elapsed = replay(session, args.fast)
+    bridge.logStats()
+    inputs = session.counts[Capture.TANGENT_IN] + session.counts[Capture.LR_IN]
+    print('Replayed %d Tangent frames and %d LR lines (%.1fs session) in %.3fs: %.0f messages/s' % (
+        session.counts[Capture.TANGENT_IN], session.counts[Capture.LR_IN], session.length,
+        elapsed, inputs / max(elapsed, 1e-9)))
+    for name, conn, kind in [('Tangent out', bridge.Tangent, Capture.TANGENT_OUT), ('LR out', bridge.LRSend, Capture.LR_OUT)]:
+        print('%-12s %8d bytes (%d in the session)' % (name, conn.sock.sent, session.bytes[kind]))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# Should work with both Python 2.7 and 3
+
+# Local stand-ins for the two ends of the bridge, so it can be run and loaded without a
+# Tangent Hub or Lightroom (e.g. on a headless Linux box):
+#  - StandInHub listens where the Tangent Hub would, speaks the Tangent framing, and plays
+#    a panel: Initiate Comms (0x01), dial turns, button presses, jog.
+#  - StandInLR listens where the Lua plugin would, acks each command with "ok" as LrSocket does,
+#    answers GetValue and echoes parameter changes back after a configurable latency.
+#  - LoadGenerator spins N dials at a set tick rate and measures how the bridge keeps up.
+#
+#   ./TangentSim.py                   wait for TangentBridge.py to connect, then run the load
+#   ./TangentSim.py --bridge          run a bridge in-process, on ephemeral ports
+#   ./TangentSim.py --dials 8 --rate 100 --duration 5 --lr-latency 0.005
+
+import argparse
+import collections
+import heapq
+import select
+import socket
+import sys
+import threading
+import time
+
+import TangentBridge
+from TangentBridge import Bridge, Control, FrameDecoder, LatencyHistogram, LineDecoder, \
+        TANGENT_PORT, LRSEND_PORT, LRRECV_PORT, monotonic, rd4, rd4f, u4, encf
+
+def listen(port=0):
+    ''' Returns a socket listening on localhost (port 0: an ephemeral port) '''
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    s.bind(('127.0.0.1', port))
+    s.listen(1)
+    return s
+
+def accept(server):
+    ''' Accepts one connection and closes the listener '''
+    sock = server.accept()[0]
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    server.close()
+    return sock
+
+class StandInHub(object):
+    '''
+    Plays the Tangent Hub. Call accept() once the bridge is connecting, then initiate().
+    What the bridge sends back is counted by command, and the latest value it sent for each
+    parameter is kept in `shown`.
+    '''
+    def __init__(self, port=TANGENT_PORT):
+        self.server = listen(port)
+        self.port = self.server.getsockname()[1]
+        self.sock = None
+        self.received = collections.Counter() # cmd -> frames
+        self.shown = {} # param -> (value, when)
+        self.ready = threading.Event() # set when the bridge has answered Initiate Comms
+        self.lock = threading.Lock()
+
+    def accept(self):
+        self.sock = accept(self.server)
+        t = threading.Thread(target=self.receive, name='stand-in hub')
+        t.daemon = True
+        t.start()
+
+    def receive(self):
+        frames = FrameDecoder()
+        while True:
+            try:
+                data = self.sock.recv(65536)
+            except socket.error:
+                return
+            if not data:
+                return
+            now = monotonic()
+            for frame in frames.feed(data):
+                cmd = rd4(frame)
+                self.received[cmd] += 1
+                if cmd == 0x81:
+                    self.ready.set()
+                elif cmd == 0x82:
+                    self.shown[rd4(frame, 4)] = (rd4f(frame, 8), now)
+
+    def send(self, *pkts):
+        ''' Sends one or more packets in a single write '''
+        data = bytearray()
+        for pkt in pkts:
+            data += u4(len(pkt)) + pkt
+        with self.lock:
+            self.sock.sendall(data)
+
+    def close(self):
+        if self.sock:
+            # Shut down first: while the receiving thread is blocked on it, close() alone doesn't end the connection
+            self.sock.shutdown(socket.SHUT_RDWR)
+            self.sock.close()
+
+    # Panel traffic
+    def initiate(self, panels=1):
+        ''' Initiate Comms (protocol rev 5), as the Hub sends on connecting; waits for the bridge to answer '''
+        pkt = u4(0x01) + u4(5) + u4(panels)
+        for i in range(panels):
+            pkt += u4(0x0c) + u4(i) # panel type, ID
+        self.send(pkt)
+        self.ready.wait(5)
+
+    @staticmethod
+    def turn(param, incr):
+        return u4(0x02) + u4(param) + encf(incr)
+
+    @staticmethod
+    def read(param):
+        return u4(0x04) + u4(param)
+
+    @staticmethod
+    def press(button):
+        return u4(0x08) + u4(button)
+
+    @staticmethod
+    def release(button):
+        return u4(0x0b) + u4(button)
+
+    @staticmethod
+    def mode(mode):
+        return u4(0x09) + u4(mode)
+
+    @staticmethod
+    def jog(steps, shuttle=0):
+        return u4(0x0a) + u4(steps) + u4(shuttle)
+
+class StandInLR(threading.Thread):
+    '''
+    Plays the Lua plugin. Each command is acked with "ok" on the socket it came in on, as LrSocket does.
+    GetValue is answered, and changes to known parameters are echoed back (as LR's change observer
+    would), `latency` seconds later. Pass listening sockets to serve() or connected ones to attach().
+    '''
+    def __init__(self, latency=0.005, ack=True):
+        super(StandInLR, self).__init__(name='stand-in LR')
+        self.daemon = True
+        self.latency = latency
+        self.ack = ack
+        self.values = {} # name -> value
+        self.received = collections.Counter() # command name -> count
+        self.arrivals = [] # (when, name) of each parameter value received, in order
+        self.lrsend = None
+        self.lrrecv = None
+
+    def serve(self, sendServer, recvServer):
+        ''' Accepts the bridge's connections on the given listening sockets, then starts '''
+        self.attach(accept(sendServer), accept(recvServer))
+
+    def attach(self, lrsend, lrrecv):
+        self.lrsend = lrsend
+        self.lrrecv = lrrecv
+        self.start()
+
+    def run(self):
+        lines = LineDecoder()
+        pending = [] # heap of (when due, reply)
+        while True:
+            timeout = None
+            if pending:
+                timeout = max(0, pending[0][0] - monotonic())
+            rlist,_,_ = select.select([self.lrsend], [], [], timeout)
+            if rlist:
+                try:
+                    data = self.lrsend.recv(65536)
+                except socket.error:
+                    return
+                if not data:
+                    return
+                now = monotonic()
+                acks = b''
+                for line in lines.feed(data):
+                    name, _, value = line.partition(b' ')
+                    self.received[name] += 1
+                    acks += b'ok\n'
+                    if name == b'GetValue':
+                        reply = b'%s %g\n' % (value, self.values.get(value, 0.5))
+                        heapq.heappush(pending, (now + self.latency, reply))
+                    elif name.decode('ascii') in Control.by_name:
+                        self.values[name] = float(value)
+                        self.arrivals.append((now, name))
+                        heapq.heappush(pending, (now + self.latency, line + b'\n'))
+                if self.ack and acks:
+                    self.lrsend.sendall(acks)
+            now = monotonic()
+            replies = b''
+            while pending and pending[0][0] <= now:
+                replies += heapq.heappop(pending)[1]
+            if replies:
+                try:
+                    self.lrrecv.sendall(replies)
+                except socket.error:
+                    return
+
+    def close(self):
+        for s in (self.lrsend, self.lrrecv):
+            if s:
+                s.close()
+
+def start_bridge(hub, lrSendServer, lrRecvServer, cls=Bridge, **kwargs):
+    '''
+    Starts a Bridge in a thread, connecting to `hub` (a StandInHub, or a plain listening socket)
+    and the LR listening sockets. Returns (bridge, hub socket, LR send socket, LR receive socket, thread).
+    The bridge keeps trying to reconnect if the sockets are closed; stop it with stop_bridge().
+    '''
+    ports = [ hub.port if isinstance(hub, StandInHub) else hub.getsockname()[1],
+              lrSendServer.getsockname()[1], lrRecvServer.getsockname()[1] ]
+    made = []
+    t = threading.Thread(target=lambda: made.append(cls(sys.argv[0], *ports, **kwargs)))
+    t.start()
+    if isinstance(hub, StandInHub):
+        hub.accept()
+        hubSock = hub.sock
+    else:
+        hubSock = accept(hub)
+    lrsend, lrrecv = accept(lrSendServer), accept(lrRecvServer)
+    t.join()
+    bridge = made[0]
+    t = threading.Thread(target=bridge.run, name='bridge')
+    t.daemon = True
+    t.start()
+    return bridge, hubSock, lrsend, lrrecv, t
+
+def stop_bridge(bridge, thread, *ends):
+    '''
+    Stops a bridge started by start_bridge, and waits for its thread to finish. `ends` are the
+    stand-ins for its connections (StandInHub, StandInLR or sockets); they are closed, which wakes
+    the bridge's main loop to notice it is to halt.
+    '''
+    bridge.halt = True
+    for end in ends:
+        end.close()
+    thread.join()
+
+def in_process(lrLatency=0.005):
+    '''
+    Starts the stand-ins, and a bridge connected to them on ephemeral ports, in this process.
+    Returns (hub, LR, bridge, bridge thread); stop it with stop_bridge(bridge, thread, hub, LR).
+    '''
+    hub = StandInHub(0)
+    bridge, _, lrsend, lrrecv, thread = start_bridge(hub, listen(), listen())
+    lr = StandInLR(lrLatency)
+    lr.attach(lrsend, lrrecv)
+    hub.initiate()
+    return hub, lr, bridge, thread
+
+class LoadGenerator(object):
+    '''
+    Spins `dials` dials, each ticking `rate` times a second for `duration` seconds, and measures
+    how many of the ticks reach LR, how long they take, and how long the bridge takes to drain
+    once the dials stop.
+    '''
+    def __init__(self, hub, lr, dials=8, rate=100, duration=5.0, incr=0.001):
+        self.hub = hub
+        self.lr = lr
+        self.params = sorted([ p for p in Control.by_id if p in TangentBridge.VALUES.slot ])[:dials]
+        self.rate = rate
+        self.duration = duration
+        self.incr = incr
+        self.sent = 0
+        self.latency = LatencyHistogram() # tick -> value reaches LR (earliest tick not yet seen)
+
+    def run(self):
+        names = dict((Control.by_id[p].name.encode('ascii'), p) for p in self.params)
+        firstUnseen = {} # param -> when its earliest tick not yet seen by LR was sent
+        seen = len(self.lr.arrivals)
+        period = 1.0 / self.rate
+        start = monotonic()
+        due = start
+        ticks = [ StandInHub.turn(p, self.incr) for p in self.params ]
+        back = [ StandInHub.turn(p, -self.incr) for p in self.params ]
+        while due < start + self.duration:
+            time.sleep(max(0, due - monotonic()))
+            now = monotonic()
+            # Turn back and forth every half second, so the values don't pin at the ends of their range
+            self.hub.send(*(back if int((now - start) * 2) % 2 else ticks))
+            self.sent += len(ticks)
+            for p in self.params:
+                firstUnseen.setdefault(p, now)
+            seen = self.collect(names, firstUnseen, seen)
+            due += period
+        end = monotonic()
+        # Wait for the bridge to go quiet
+        while True:
+            time.sleep(0.1)
+            before = seen
+            seen = self.collect(names, firstUnseen, seen)
+            if seen == before:
+                break
+        drained = self.lr.arrivals[-1][0] - end if self.lr.arrivals else 0
+        return end - start, max(0, drained)
+
+    def values(self):
+        ''' How many values for the dials LR has received '''
+        return sum([ self.lr.received[Control.by_id[p].name.encode('ascii')] for p in self.params ])
+
+    def collect(self, names, firstUnseen, seen):
+        arrivals = self.lr.arrivals
+        count = len(arrivals)
+        for when, name in arrivals[seen:count]:
+            p = names.get(name)
+            if p is not None and p in firstUnseen:
+                self.latency.record(when - firstUnseen.pop(p))
+        return count
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs stand-ins for the Tangent Hub and Lightroom, and loads the bridge')
+    parser.add_argument('--bridge', action='store_true', help='run a bridge in-process, rather than waiting for TangentBridge.py')
+    parser.add_argument('--dials', type=int, default=8, help='how many dials to turn at once')
+    parser.add_argument('--rate', type=float, default=100, help='ticks per second per dial')
+    parser.add_argument('--duration', type=float, default=5, help='seconds to turn the dials for')
+    parser.add_argument('--lr-latency', type=float, default=0.005, help='seconds LR takes to answer')
+    args = parser.parse_args()
+
+    if args.bridge:
+        hub, lr, bridge, thread = in_process(args.lr_latency)
+    else:
+        hub = StandInHub(TANGENT_PORT)
+        lrSendServer, lrRecvServer = listen(LRSEND_PORT), listen(LRRECV_PORT)
+        print('Waiting for the bridge to connect...')
+        hub.accept()
+        lr = StandInLR(args.lr_latency)
+        lr.serve(lrSendServer, lrRecvServer)
+        hub.initiate()
+
+    load = LoadGenerator(hub, lr, args.dials, args.rate, args.duration)
+    elapsed, drained = load.run()
+    values = load.values()
+    print('%d dials at %g Hz for %gs: sent %d ticks (%.0f/s)' % (
+        args.dials, args.rate, args.duration, load.sent, load.sent / elapsed))
+    print('LR received %d values (%.0f/s, %.1f ticks per value); hub received %d display updates' % (
+        values, values / elapsed, load.sent / float(max(values, 1)), hub.received[0x82]))
+    print('tick -> LR latency: %s' % load.latency.summary())
+    print('drained %.1fms after the last tick' % (drained * 1000))
+    if args.bridge:
+        stop_bridge(bridge, thread, hub, lr)
+    else:
+        hub.close()
+        lr.close()
+
+if __name__ == '__main__':
+    main()